@@ -3,71 +3,17 @@
 import pandas as pd
 import geopandas as gpd
 import maup
+import os
 import time
 from pyproj import CRS
 import pickle
 from gerrychain import Graph
-
-maup.progress.enabled = True
-
-#population
-start_time = time.time()
-population_df = gpd.read_file("./il_pl2020_b/il_pl2020_p2_b.shp")
-end_time = time.time()
-print("The time to import the Population shape file is:",
-      (end_time-start_time)/60, "mins")
-
-#voting age population
-start_time = time.time()
-vap_df= gpd.read_file("./il_pl2020_b/il_pl2020_p4_b.shp")
-end_time = time.time()
-print("The time to import VAP shape file is:",
-      (end_time-start_time)/60, "mins")
-
-#2020 election
-start_time = time.time()
-election_df = gpd.read_file("./il_vest_20/il_vest_20.shp")
-end_time = time.time()
-print("The time to import the 2020 VEST shape file is:",
-      (end_time-start_time)/60, "mins")
-
-#congressional district data
-start_time = time.time()
-district_df = gpd.read_file("./il_sldu_2021/il_sldu_2021.shp")
-end_time = time.time()
-print(district_df.geometry)
-print("The time to import the Congressional District data shapefile is:",
-      (end_time-start_time)/60, "mins")
-
-# Print column names from imported DataFrames 
-print("population:")
-print(population_df.columns)
-print("VAP:")
-print(vap_df.columns)
-print(election_df.columns)
-print("district:")
-print(district_df.columns)
-print("election:")
-print(election_df)
-
-# Checks data integrity using Maup doctor
-print(maup.doctor(population_df)) # - True
-print(maup.doctor(vap_df)) # - True
-print(maup.doctor(election_df)) # - True
-print(maup.doctor(district_df)) # - True
-
-# Convert DataFrames to their estimated UTM coordinate reference systems
-election_df = election_df.to_crs(election_df.estimate_utm_crs())
-population_df = population_df.to_crs(population_df.estimate_utm_crs())
-vap_df = vap_df.to_crs(vap_df.estimate_utm_crs())
-district_df = district_df.to_crs(district_df.estimate_utm_crs())
-# Prints current CRS of DataFrames
-print(population_df.crs,"    ", vap_df.crs, "      ", election_df.crs, "     ", district_df.crs)
-
-# Begins precincts assignment from block data
-print("start blocks to precincts assignment")
-blocks_to_precincts_assignment = maup.assign(population_df.geometry, election_df.geometry)
-vap_blocks_to_precincts_assignment = maup.assign(vap_df.geometry, election_df.geometry)
+from graph_cache import build_graph_artifact
+from block_assignment import assign
+from stage_cache import StageCache, SourceFile
+from ingest import read_columns
+from district_summary import district_summary, write_district_summary
+from config import DEFAULT_CONFIG
 
 #Gets only these columns from pop and vap shapefiles
 pop_column_names = ['P0020001', 'P0020002', 'P0020005', 'P0020006', 'P0020007',
@@ -75,33 +21,6 @@ pop_column_names = ['P0020001', 'P0020002', 'P0020005', 'P0020006', 'P0020007',
 vap_column_names = ['P0040001', 'P0040002', 'P0040005', 'P0040006', 'P0040007',
                     'P0040008', 'P0040009', 'P0040010', 'P0040011']
 
-# Aggregates specific columns from population and VAP DataFrames into the election DataFrame
-for name in pop_column_names:
-    election_df[name] = population_df[name].groupby(blocks_to_precincts_assignment).sum()
-for name in vap_column_names:
-    election_df[name] = vap_df[name].groupby(vap_blocks_to_precincts_assignment).sum()
-
-# Prints sums for verification of assignments
-print(population_df['P0020001'].sum())
-print(election_df['P0020001'].sum())
-print(vap_df['P0040001'].sum())
-print(election_df['P0040001'].sum())
-
-# Begins precincts to districts assignment
-print("start precincts to district assignment")
-precincts_to_districts_assignment = maup.assign(election_df.geometry, district_df.geometry)
-print("finish precincts to district assignment")
-
-# Updates precincts to district mapping in the election DataFrame
-district_col_name = "DISTRICTN"
-election_df["SSD"] = precincts_to_districts_assignment
-
-print(set(election_df["SSD"]))
-for precinct_index in range(len(election_df)):
-    election_df.at[precinct_index, "SSD"] = district_df.at[election_df.at[precinct_index, "SSD"], district_col_name]
-print(set(district_df[district_col_name]))
-print(set(election_df["SSD"]))
-
 # Renames the columns according to the dictionary
 rename_dict = {'P0020001': 'TOTPOP', 'P0020002': 'HISP', 'P0020005': 'NH_WHITE', 'P0020006': 'NH_BLACK', 'P0020007': 'NH_AMIN',
                     'P0020008': 'NH_ASIAN', 'P0020009': 'NH_NHPI', 'P0020010': 'NH_OTHER', 'P0020011': 'NH_2MORE',
@@ -110,29 +29,159 @@ rename_dict = {'P0020001': 'TOTPOP', 'P0020002': 'HISP', 'P0020005': 'NH_WHITE',
                                         'G20PREDBID': 'G20PRED', 'G20PRERTRU': 'G20PRER', 'G20USSDDUR': 'G20USSD', 
                                         'G20USSRCUR': 'G20USSR'}
 
-print(list(election_df.columns))
-
-election_df.rename(columns=rename_dict, inplace = True)
-
-print(list(election_df.columns))
 # Drops unused columns from the election DataFrame
-election_df.drop(columns=[ 'G20PRELJOR','G20PREGHAW','G20PREACAR','G20PRESLAR',  'G20USSIWIL', 'G20USSLMAL','G20USSGBLA'], inplace=True)
-print(list(election_df.columns))
-
-# Plots the updated election DataFrame
-election_df.plot()
+drop_columns = [ 'G20PRELJOR','G20PREGHAW','G20PREACAR','G20PRESLAR',  'G20USSIWIL', 'G20USSLMAL','G20USSGBLA']
 
-# Prints population totals for each district
-print(election_df.loc[election_df["SSD"] == 1, "TOTPOP"].sum())
-print(election_df.loc[election_df["SSD"] == 2, "TOTPOP"].sum())
-pop_vals = [election_df.loc[election_df["SSD"] == n, "TOTPOP"].sum() for n in range(1, 59)]
-print(pop_vals)
-
-#Creates shp file
-election_df.to_file("./IL/IL.shp")
-
-#Reads shp to make GeoJSON
-shp_file = gpd.read_file('./IL/IL.shp')
+# District number column of the senate district file
+district_col_name = "DISTRICTN"
 
-#Creates GeoJSON
-shp_file.to_file('./IL/IL.geojson', driver='GeoJSON')
+# Input and output paths, defaulting to those of config.DEFAULT_CONFIG: the
+# census block, election and district layers, IL.shp, the per-district
+# totals of the enacted plan written next to it, and the directory holding
+# the cached results of the pipeline stages below
+paths = DEFAULT_CONFIG["paths"]
+
+
+# Pipeline stages. Each one is run through StageCache, which stores its
+# result keyed by its inputs, so a rerun only recomputes the stages whose
+# inputs changed.
+
+def read_layer(path, columns=None, exclude=()):
+    # Imports the needed columns of a shapefile (through its GeoParquet copy),
+    # checks its data integrity using maup doctor, and converts it to its
+    # estimated UTM coordinate reference system
+    start_time = time.time()
+    df = read_columns(path, columns, exclude)
+    end_time = time.time()
+    print("The time to import", path, "is:",
+          (end_time-start_time)/60, "mins")
+    print(df.columns)
+    print(maup.doctor(df)) # - True
+    df = df.to_crs(df.estimate_utm_crs())
+    print(df.crs)
+    return df
+
+
+def layer_geometry(df):
+    # Only the geometry feeds the spatial assignments, so changes to a
+    # layer's attribute columns do not invalidate them
+    return df.geometry
+
+
+def aggregate(election_df, population_df, vap_df, blocks_to_precincts_assignment,
+              vap_blocks_to_precincts_assignment):
+    # Aggregates specific columns from population and VAP DataFrames into the election DataFrame
+    election_df = election_df.copy()
+    for name in pop_column_names:
+        election_df[name] = population_df[name].groupby(blocks_to_precincts_assignment).sum()
+    for name in vap_column_names:
+        election_df[name] = vap_df[name].groupby(vap_blocks_to_precincts_assignment).sum()
+
+    # Prints sums for verification of assignments
+    print(population_df['P0020001'].sum())
+    print(election_df['P0020001'].sum())
+    print(vap_df['P0040001'].sum())
+    print(election_df['P0040001'].sum())
+    return election_df
+
+
+def label_districts(election_df, district_df, precincts_to_districts_assignment):
+    election_df = election_df.copy()
+    # Updates precincts to district mapping in the election DataFrame
+    election_df["SSD"] = precincts_to_districts_assignment
+
+    print(set(election_df["SSD"]))
+    # Replaces each district row label with that district's number in one lookup
+    election_df["SSD"] = election_df["SSD"].map(district_df[district_col_name])
+    print(set(district_df[district_col_name]))
+    print(set(election_df["SSD"]))
+
+    print(list(election_df.columns))
+
+    election_df.rename(columns=rename_dict, inplace = True)
+
+    print(list(election_df.columns))
+    # (the dropped columns are not loaded in the first place; this only
+    # matters if a layer is read with every column)
+    election_df.drop(columns=drop_columns, inplace=True, errors="ignore")
+    print(list(election_df.columns))
+    return election_df
+
+
+def preprocess(population_path=paths["population"], vap_path=paths["vap"],
+               election_path=paths["election"], district_path=paths["districts"],
+               output_path=paths["shapefile"], summary_path=paths["summary_file"],
+               cache_path=paths["stage_cache"]):
+    # Builds IL.shp (and its district summary, graph artifact and GeoJSON)
+    # from the census block, election and district layers
+    maup.progress.enabled = True
+    cache = StageCache(cache_path)
+
+    #population, voting age population, 2020 election, and congressional district data
+    # Only the columns used below are loaded; the VEST file keeps every
+    # column that ends up in IL.shp
+    population = cache.run("read_population", read_layer, SourceFile(population_path),
+                           columns=pop_column_names)
+    vap = cache.run("read_vap", read_layer, SourceFile(vap_path),
+                    columns=vap_column_names)
+    election = cache.run("read_election", read_layer, SourceFile(election_path),
+                         exclude=drop_columns)
+    district = cache.run("read_district", read_layer, SourceFile(district_path),
+                         columns=[district_col_name])
+
+    block_geometry = cache.run("layer_geometry", layer_geometry, population)
+    vap_block_geometry = cache.run("layer_geometry", layer_geometry, vap)
+    precinct_geometry = cache.run("layer_geometry", layer_geometry, election)
+    district_geometry = cache.run("layer_geometry", layer_geometry, district)
+
+    # Begins precincts assignment from block data. The P2 and P4 files carry the
+    # same census blocks, so the second assignment has the same key as the
+    # first and comes straight from the cache.
+    print("start blocks to precincts assignment")
+    blocks_to_precincts = cache.run("assign_blocks", assign, block_geometry, precinct_geometry)
+    vap_blocks_to_precincts = cache.run("assign_blocks", assign, vap_block_geometry, precinct_geometry)
+
+    aggregated = cache.run("aggregate", aggregate, election, population, vap,
+                           blocks_to_precincts, vap_blocks_to_precincts)
+
+    # Begins precincts to districts assignment
+    print("start precincts to district assignment")
+    precincts_to_districts = cache.run("assign_precincts", assign, precinct_geometry, district_geometry)
+    print("finish precincts to district assignment")
+
+    labeled = cache.run("label_districts", label_districts, aggregated, district,
+                        precincts_to_districts)
+    election_df = labeled.value
+
+    # Plots the updated election DataFrame
+    election_df.plot()
+
+    # Sums population, VAP and votes by district in one pass, prints the
+    # population totals for each district and saves the table as the enacted
+    # plan's baseline for the ensemble scripts
+    summary = district_summary(election_df, "SSD", num_dist=len(district.value))
+    print(summary["TOTPOP"].tolist())
+    print(summary)
+
+    #Creates shp file
+    election_df.to_file(output_path)
+
+    write_district_summary(summary, summary_path)
+
+    #Rebuilds the cached dual graph the chain scripts load
+    build_graph_artifact(output_path)
+
+    #Reads shp to make GeoJSON
+    shp_file = gpd.read_file(output_path)
+
+    #Creates GeoJSON
+    shp_file.to_file(os.path.splitext(output_path)[0] + '.geojson', driver='GeoJSON')
+
+    # Reports which stages came from the cache and how long each one took
+    cache.print_report()
+
+
+# The block assignment runs in a process pool, so the script body only runs
+# when executed directly (worker processes may re-import this module)
+if __name__ == "__main__":
+    preprocess()
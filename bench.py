@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for the ensemble chain on synthetic dual graphs.
+
+Two kinds of graph are generated at several sizes, without needing
+./IL/IL.shp:
+
+- ``grid``: a rows x columns grid of unit squares;
+- ``triangulated``: the triangles of a Delaunay triangulation of random
+  points, adjacent when they share an edge.
+
+Every unit gets fake ``TOTPOP``, vote and VAP columns, and the starting
+plan is drawn with ``recursive_tree_part``. Everything is seeded, so a
+given seed and size always produce the same graphs and plans.
+
+For each graph the suite times graph loading (``Graph.from_geodataframe``
+and the cached artifact of graph_cache.py), single proposals (``recom``
+and ``fast_recom``), evaluating every updater of the chain on a new plan,
+scoring a plan from scratch with district_summary.py (one at a time and
+as a stacked block of plans), and the full chain as demwin_ensemble.py
+runs it (steps per second, output excluded), also with every phase
+wrapped by chain_profiler.py.
+
+Results are appended to a JSON lines file, one line per graph and
+measurement, tagged with the git commit, so runs from different commits
+can be compared:
+
+    python bench.py run --sizes small medium
+    python bench.py compare 1a2b3c4 5d6e7f8
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+
+# Nodes and districts of each benchmark size (the Illinois senate map has
+# about 10,000 precincts in 59 districts)
+SIZES = {
+    "small": (400, 4),
+    "medium": (2500, 15),
+    "large": (10000, 59),
+}
+GRAPH_KINDS = ("grid", "triangulated")
+
+# Fake columns added to every unit, drawn uniformly from these ranges
+FAKE_COLUMNS = {
+    "TOTPOP": (500, 1500),
+    "G20PRED": (50, 500),
+    "G20PRER": (50, 500),
+    "G20USSD": (50, 500),
+    "G20USSR": (50, 500),
+    # Voting-age population, drawn so that WVAP stays below VAP
+    "VAP": (400, 1200),
+    "HVAP": (0, 400),
+    "WVAP": (0, 400),
+    "BVAP": (0, 400),
+    "AMINVAP": (0, 20),
+    "ASIANVAP": (0, 200),
+    "NHPIVAP": (0, 10),
+    "OTHERVAP": (0, 20),
+    "2MOREVAP": (0, 40),
+}
+
+results_file = os.path.join("benchmarks", "results.jsonl")
+
+
+def git_commit():
+    # Commit the benchmarked code came from, marked when the tree has changes
+    repo = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=repo,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=repo,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return commit + ("-dirty" if dirty else "")
+
+
+def grid_units(n_nodes, seed):
+    """GeoDataFrame of a square grid of about ``n_nodes`` unit squares with fake columns."""
+    import geopandas as gpd
+    from shapely import box
+
+    side = int(round(np.sqrt(n_nodes)))
+    x, y = np.meshgrid(np.arange(side), np.arange(side))
+    geometry = box(x.ravel(), y.ravel(), x.ravel() + 1, y.ravel() + 1)
+    return _with_fake_columns(gpd.GeoDataFrame(geometry=geometry), seed)
+
+
+def triangulated_units(n_nodes, seed):
+    """GeoDataFrame of the ``n_nodes`` or so triangles of a random Delaunay triangulation."""
+    import geopandas as gpd
+    from scipy.spatial import Delaunay
+    from shapely import polygons
+
+    # A triangulation of n points has about 2n triangles
+    rng = np.random.default_rng(seed)
+    points = rng.random((n_nodes // 2 + 2, 2)) * np.sqrt(n_nodes)
+    triangles = points[Delaunay(points).simplices]
+    return _with_fake_columns(gpd.GeoDataFrame(geometry=polygons(triangles)), seed)
+
+
+def _with_fake_columns(units, seed):
+    # Coordinates are in units of one grid square; any projected CRS will do
+    units = units.set_crs("EPSG:32616")
+    rng = np.random.default_rng(seed)
+    for name, (low, high) in FAKE_COLUMNS.items():
+        units[name] = rng.integers(low, high, len(units))
+    return units
+
+
+def make_graph(kind, n_nodes, districts, seed):
+    """Units, dual graph and starting plan (column ``SSD``) of one benchmark graph."""
+    from gerrychain import Graph
+    from gerrychain.tree import recursive_tree_part
+
+    units = grid_units(n_nodes, seed) if kind == "grid" else triangulated_units(n_nodes, seed)
+    graph = Graph.from_geodataframe(units, ignore_errors=True)
+    random.seed(seed)
+    total = sum(graph.nodes[node]["TOTPOP"] for node in graph.nodes)
+    plan = recursive_tree_part(graph, range(1, districts + 1), total / districts, "TOTPOP", 0.02)
+    for node, district in plan.items():
+        graph.nodes[node]["SSD"] = district
+    return units, graph
+
+
+def _best_of(function, repeats):
+    # Smallest wall time of several runs, the least noisy estimate
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def bench_loading(units, graph, repeats=3):
+    from gerrychain import Graph
+    from graph_cache import read_graph, save_graph
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "graph.npz")
+        save_graph(graph, path)
+        return {
+            "from_geodataframe_s": _best_of(
+                lambda: Graph.from_geodataframe(units, ignore_errors=True), 1),
+            "read_artifact_s": _best_of(lambda: read_graph(path), repeats),
+        }
+
+
+def bench_proposals(partition, pop_target, samples):
+    from gerrychain.proposals import recom
+    from fast_recom import fast_recom
+    import demwin_ensemble
+
+    results = {}
+    for proposal in (recom, fast_recom):
+        random.seed(0)
+        start = time.perf_counter()
+        for _ in range(samples):
+            proposal(partition, "TOTPOP", pop_target, demwin_ensemble.pop_tolerance)
+        results[proposal.__name__ + "_s"] = (time.perf_counter() - start) / samples
+    return results
+
+
+def bench_updaters(partition, pop_target, samples):
+    # Cost of the chain's updaters on a new plan, and of scoring a plan
+    # from scratch with district_summary.partisan_scores
+    from district_summary import ELECTIONS, district_votes, partisan_scores
+    from fast_recom import fast_recom
+    import demwin_ensemble
+
+    random.seed(0)
+    proposed = [fast_recom(partition, "TOTPOP", pop_target, demwin_ensemble.pop_tolerance)
+                for _ in range(samples)]
+    districts = range(1, demwin_ensemble.num_dist + 1)
+    dem_keys = [dem for dem, rep in ELECTIONS.values()]
+    rep_keys = [rep for dem, rep in ELECTIONS.values()]
+
+    start = time.perf_counter()
+    for part in proposed:
+        for name in part.updaters:
+            part[name]
+    updaters_s = (time.perf_counter() - start) / samples
+
+    start = time.perf_counter()
+    for part in proposed:
+        partisan_scores(*district_votes(part, dem_keys, rep_keys, districts))
+    metrics_s = (time.perf_counter() - start) / samples
+
+    # The same plans stacked into one (steps x districts x elections) block
+    votes = [district_votes(part, dem_keys, rep_keys, districts) for part in proposed]
+    dem = np.stack([d for d, r in votes])
+    rep = np.stack([r for d, r in votes])
+    start = time.perf_counter()
+    partisan_scores(dem, rep)
+    metrics_block_s = (time.perf_counter() - start) / samples
+    return {"updaters_s": updaters_s, "metrics_s": metrics_s, "metrics_block_s": metrics_block_s}
+
+
+def bench_chain(graph, partition, steps):
+    import demwin_ensemble
+
+    random.seed(0)
+    chain = demwin_ensemble.make_chain(graph, partition, steps)
+    start = time.perf_counter()
+    for part in chain:
+        demwin_ensemble.ensemble_row(part)
+    return {"chain_steps_per_s": steps / (time.perf_counter() - start)}
+
+
+def bench_profiled_chain(graph, partition, steps):
+    # The same chain instrumented by ChainProfiler: its overhead, and a
+    # check that every updater still works when wrapped
+    from chain_profiler import ChainProfiler
+    import demwin_ensemble
+
+    random.seed(0)
+    chain = ChainProfiler(report_every=0).instrument(
+        demwin_ensemble.make_chain(graph, partition, steps))
+    start = time.perf_counter()
+    for part in chain:
+        demwin_ensemble.ensemble_row(part)
+    return {"profiled_chain_steps_per_s": steps / (time.perf_counter() - start)}
+
+
+def run_suite(sizes, kinds=GRAPH_KINDS, seed=2024, samples=50, steps=500, path=results_file):
+    """Run every benchmark on every graph, append the results to ``path`` and return them."""
+    import gerrychain
+    import demwin_ensemble
+
+    header = {
+        "commit": git_commit(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "gerrychain": gerrychain.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "seed": seed,
+    }
+    records = []
+    for size in sizes:
+        n_nodes, districts = SIZES[size]
+        for kind in kinds:
+            units, graph = make_graph(kind, n_nodes, districts, seed)
+            # The chain functions read the district count from the module settings
+            demwin_ensemble.num_dist = districts
+            partition = demwin_ensemble.make_initial_partition(graph)
+            pop_target = sum(partition["population"].values()) / districts
+            graph_info = dict(header, size=size, graph=kind, nodes=len(graph),
+                              edges=graph.number_of_edges(), districts=districts)
+
+            measurements = {
+                "loading": lambda: bench_loading(units, graph),
+                "proposal": lambda: bench_proposals(partition, pop_target, samples),
+                "updaters": lambda: bench_updaters(partition, pop_target, samples),
+                "chain": lambda: bench_chain(graph, partition, steps),
+                # On a fresh partition, as instrumenting wraps its updaters in place
+                "profiled_chain": lambda: bench_profiled_chain(
+                    graph, demwin_ensemble.make_initial_partition(graph), steps),
+            }
+            for name, measure in measurements.items():
+                record = dict(graph_info, benchmark=name, **measure())
+                print(json.dumps(record))
+                records.append(record)
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+    return records
+
+
+def read_results(path=results_file):
+    import pandas as pd
+
+    with open(path) as f:
+        return pd.DataFrame([json.loads(line) for line in f if line.strip()])
+
+
+def compare(base, other, path=results_file):
+    """
+    Table of every measurement for two commits (the best run of each), with
+    the ratio other / base.
+    """
+    results = read_results(path)
+    keys = ["size", "graph", "benchmark"]
+    values = [c for c in results.columns if c.endswith("_s") or c.endswith("_per_s")]
+    long = results.melt(id_vars=keys + ["commit"], value_vars=values, var_name="measure").dropna()
+    # Times are best when lowest, rates when highest
+    rate = long["measure"].str.endswith("_per_s")
+    long.loc[rate, "value"] = -long.loc[rate, "value"]
+    best = long.groupby(["commit"] + keys + ["measure"])["value"].min().abs()
+    table = best.unstack("commit")[[base, other]].dropna()
+    table["ratio"] = table[other] / table[base]
+    return table
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run_parser = subparsers.add_parser("run", help="run the suite and append the results")
+    run_parser.add_argument("--sizes", nargs="+", choices=list(SIZES), default=["small", "medium"])
+    run_parser.add_argument("--graphs", nargs="+", choices=GRAPH_KINDS, default=list(GRAPH_KINDS))
+    run_parser.add_argument("--seed", type=int, default=2024)
+    run_parser.add_argument("--samples", type=int, default=50,
+                            help="proposals timed per graph")
+    run_parser.add_argument("--steps", type=int, default=500,
+                            help="chain steps timed per graph")
+    run_parser.add_argument("--output", default=results_file)
+    compare_parser = subparsers.add_parser("compare", help="compare the results of two commits")
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("other")
+    compare_parser.add_argument("--output", default=results_file)
+    args = parser.parse_args()
+
+    if args.command == "run":
+        run_suite(args.sizes, args.graphs, args.seed, args.samples, args.steps, args.output)
+    else:
+        print(compare(args.base, args.other, args.output).to_string())
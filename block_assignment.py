@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Spatially indexed, parallel replacement for ``maup.assign``.
+
+The targets (precincts) go into one STRtree per worker process. The sources
+(census blocks) are split into square tiles by the centre of their bounding
+boxes, and each tile is assigned in the process pool with vectorized
+shapely queries. The rules are the ones ``maup.assign`` uses (as of
+maup 2.0, whose area step drops intersections without area):
+
+1. a source covered by exactly one target is assigned to it;
+2. any other source goes to the target it shares the largest positive
+   area with (the first such target on ties);
+3. sources sharing no area with any target (including those that only
+   touch a target's boundary) stay unassigned (NaN) with a warning.
+
+As in maup, both layers must have the same CRS.
+
+Example:
+
+    assignment = assign(blocks.geometry, precincts.geometry)
+"""
+import os
+import warnings
+from multiprocessing import Pool
+
+import numpy as np
+import pandas as pd
+import shapely
+from shapely import STRtree
+
+# Targets and their spatial index, built once per worker by _init_worker
+_targets = None
+_tree = None
+
+
+class AssignmentWarning(UserWarning):
+    pass
+
+
+def _init_worker(targets):
+    global _targets, _tree
+    _targets = targets
+    _tree = STRtree(targets)
+
+
+def _assign_tile(tile):
+    positions, sources = tile
+    assigned = np.full(len(sources), -1, dtype=np.int64)
+
+    # Sources covered by exactly one target
+    source_i, target_j = _tree.query(sources, predicate="covered_by")
+    counts = np.bincount(source_i, minlength=len(sources))
+    unique = counts[source_i] == 1
+    assigned[source_i[unique]] = target_j[unique]
+
+    # Everything else goes to the target with the largest overlap
+    rest = np.flatnonzero(counts != 1)
+    if len(rest):
+        source_i, target_j = _tree.query(sources[rest], predicate="intersects")
+        areas = shapely.area(shapely.intersection(sources[rest][source_i], _targets[target_j]))
+        keep = areas > 0
+        source_i, target_j, areas = source_i[keep], target_j[keep], areas[keep]
+        # Largest area first within each source, lowest target on ties
+        order = np.lexsort((target_j, -areas, source_i))
+        source_i, target_j = source_i[order], target_j[order]
+        first = np.ones(len(source_i), dtype=bool)
+        first[1:] = source_i[1:] != source_i[:-1]
+        assigned[rest[source_i[first]]] = target_j[first]
+
+    return positions, assigned
+
+
+def _tiles(sources, n_tiles):
+    # Groups the sources into roughly n_tiles square tiles by bounding-box centre
+    bounds = shapely.bounds(sources)
+    x = (bounds[:, 0] + bounds[:, 2]) / 2
+    y = (bounds[:, 1] + bounds[:, 3]) / 2
+    side = max(int(np.ceil(np.sqrt(n_tiles))), 1)
+    col = np.minimum(((x - x.min()) / (np.ptp(x) or 1) * side).astype(int), side - 1)
+    row = np.minimum(((y - y.min()) / (np.ptp(y) or 1) * side).astype(int), side - 1)
+    tile_ids = row * side + col
+    order = np.argsort(tile_ids, kind="stable")
+    splits = np.flatnonzero(np.diff(tile_ids[order])) + 1
+    return [(positions, sources[positions]) for positions in np.split(order, splits)]
+
+
+def assign(sources, targets, processes=None, tiles_per_process=4):
+    """
+    Assign each source geometry to a target, with the same result as
+    ``maup.assign(sources, targets)``.
+
+    Returns a Series indexed like ``sources`` holding target index labels.
+    ``processes`` defaults to one worker per core; pass 1 to run in this
+    process. Raises TypeError if the layers' CRS differ, as maup does.
+    """
+    source_crs, target_crs = getattr(sources, "crs", None), getattr(targets, "crs", None)
+    if source_crs != target_crs:
+        raise TypeError("the source and target geometries must have the same CRS. {} {}".format(
+            source_crs, target_crs))
+    source_geoms = np.asarray(getattr(sources, "geometry", sources).values)
+    target_geoms = np.asarray(getattr(targets, "geometry", targets).values)
+    processes = processes or os.cpu_count()
+    tiles = _tiles(source_geoms, tiles_per_process * processes)
+
+    if processes == 1:
+        _init_worker(target_geoms)
+        results = [_assign_tile(tile) for tile in tiles]
+    else:
+        with Pool(processes, initializer=_init_worker, initargs=(target_geoms,)) as pool:
+            results = pool.map(_assign_tile, tiles)
+
+    assigned = np.full(len(source_geoms), -1, dtype=np.int64)
+    for positions, tile_assigned in results:
+        assigned[positions] = tile_assigned
+
+    found = assigned >= 0
+    if found.all():
+        return pd.Series(targets.index.take(assigned), index=sources.index)
+    warnings.warn("Some units in the source geometry were unassigned.", AssignmentWarning)
+    # Labels of any index type, NaN for the unassigned sources (float for
+    # a numeric index, as maup gives)
+    labels = np.full(len(source_geoms), np.nan, dtype=object)
+    labels[found] = targets.index.take(assigned[found])
+    return pd.Series(labels, index=sources.index).infer_objects()
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Optional per-phase profiling of a GerryChain MarkovChain run.
+
+``ChainProfiler.instrument`` wraps the pieces a chain step is made of: the
+proposal, each constraint, the acceptance function and every updater of
+the initial partition (the updaters dict is shared by all later states).
+Each call is timed on a phase stack, so the time of a phase excludes the
+phases it calls: the population constraint's own time does not include the
+``population`` Tally it reads. Updaters named in ``metric_updaters`` are
+reported as metrics, and the caller can time its own work (e.g. output)
+with ``phase``. Constraints that return False are counted as the reasons
+proposals were rejected.
+
+Every ``report_every`` steps a rolling summary of the last window is
+printed; ``report`` gives the table for the whole run. Nothing is wrapped
+unless ``instrument`` is called, so an uninstrumented chain runs exactly as
+before.
+
+Example:
+
+    profiler = ChainProfiler(report_every=1000)
+    profiler.instrument(chain)
+    for part in chain:
+        with profiler.phase("output"):
+            write(part)
+        profiler.step()
+    print(profiler.report())
+"""
+import os
+import resource
+import time
+from collections import Counter, defaultdict
+
+import numpy as np
+
+# Number of phases listed in the rolling summaries
+summary_phases = 6
+
+
+def memory_mb():
+    """Current and peak resident set size of this process, in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    try:
+        with open("/proc/self/statm") as f:
+            current = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        current = np.nan
+    return current, peak
+
+
+class _Phase:
+    # Reusable context manager timing one phase on the profiler's stack
+    __slots__ = ["profiler", "name"]
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler._enter()
+
+    def __exit__(self, *exc):
+        self.profiler._exit(self.name)
+
+
+class ChainProfiler:
+    """
+    :param report_every: Print a rolling summary every this many steps (0 for none).
+    :param metric_updaters: Names of updaters reported as metrics rather than updaters.
+    """
+
+    def __init__(self, report_every=1000, metric_updaters=()):
+        self.report_every = report_every
+        self.metric_updaters = set(metric_updaters)
+        # Per phase: calls and time excluding nested phases, for the whole
+        # run and for the current window
+        self.calls = Counter()
+        self.seconds = defaultdict(float)
+        self.window_seconds = defaultdict(float)
+        self.rejections = Counter()
+        self.window_rejections = Counter()
+        self.proposals = 0
+        self.steps = 0
+        self._stack = []
+        self._phases = {}
+        self.start_time = self.window_start = time.perf_counter()
+
+    def phase(self, name):
+        if name not in self._phases:
+            self._phases[name] = _Phase(self, name)
+        return self._phases[name]
+
+    def _enter(self):
+        # [start time, time spent in nested phases]
+        self._stack.append([time.perf_counter(), 0.0])
+
+    def _exit(self, name):
+        start, nested = self._stack.pop()
+        elapsed = time.perf_counter() - start
+        if self._stack:
+            self._stack[-1][1] += elapsed
+        self.calls[name] += 1
+        self.seconds[name] += elapsed - nested
+        self.window_seconds[name] += elapsed - nested
+
+    def _timed(self, name, function):
+        phase = self.phase(name)
+
+        def timed(*args, **kwargs):
+            with phase:
+                return function(*args, **kwargs)
+        timed.profiled = True
+        timed.__name__ = getattr(function, "__name__", name)
+        return timed
+
+    def _constraint(self, constraint):
+        name = getattr(constraint, "__name__", type(constraint).__name__)
+        timed = self._timed("constraint " + name, constraint)
+
+        def checked(partition):
+            valid = timed(partition)
+            if not valid:
+                self.rejections[name] += 1
+                self.window_rejections[name] += 1
+            return valid
+        checked.profiled = True
+        checked.__name__ = name
+        return checked
+
+    def _proposal(self, proposal):
+        timed = self._timed("proposal", proposal)
+
+        def counted(partition):
+            self.proposals += 1
+            return timed(partition)
+        counted.profiled = True
+        return counted
+
+    def instrument(self, chain):
+        """Wrap the chain's proposal, constraints, acceptance and updaters in place."""
+        if not getattr(chain.proposal, "profiled", False):
+            chain.proposal = self._proposal(chain.proposal)
+            chain.accept = self._timed("accept", chain.accept)
+            chain.is_valid.constraints = [self._constraint(c) for c in chain.is_valid.constraints]
+        updaters = chain.initial_state.updaters
+        for name, updater in updaters.items():
+            if not getattr(updater, "profiled", False):
+                kind = "metric" if name in self.metric_updaters else "updater"
+                updaters[name] = self._timed("{} {}".format(kind, name), updater)
+        return chain
+
+    def step(self):
+        """Count one step of the chain, printing the rolling summary when one is due."""
+        self.steps += 1
+        if self.report_every and self.steps % self.report_every == 0:
+            print(self.window_summary())
+            self.window_seconds.clear()
+            self.window_rejections.clear()
+            self.window_start = time.perf_counter()
+
+    def window_summary(self):
+        elapsed = time.perf_counter() - self.window_start
+        current, peak = memory_mb()
+        # The most expensive phases of the window
+        slowest = sorted(self.window_seconds.items(), key=lambda item: -item[1])[:summary_phases]
+        phases = ", ".join("{} {:.2f}".format(name, 1000 * seconds / self.report_every)
+                           for name, seconds in slowest)
+        rejected = ", ".join("{} {}".format(name, count)
+                             for name, count in self.window_rejections.items()) or "none"
+        return ("step {}: {:.1f} steps/s | ms/step: {} | rejected: {} | "
+                "memory {:.0f} MB (peak {:.0f} MB)".format(
+                    self.steps, self.report_every / elapsed, phases, rejected, current, peak))
+
+    def report(self):
+        """Table of every phase over the whole run, plus rejections and memory."""
+        elapsed = time.perf_counter() - self.start_time
+        lines = ["{:<48} {:>9} {:>10} {:>12} {:>7}".format(
+            "phase", "calls", "seconds", "ms per call", "% time")]
+        for name, seconds in sorted(self.seconds.items(), key=lambda item: -item[1]):
+            lines.append("{:<48} {:>9} {:>10.2f} {:>12.3f} {:>7.1f}".format(
+                name[:48], self.calls[name], seconds, 1000 * seconds / self.calls[name],
+                100 * seconds / elapsed))
+        other = elapsed - sum(self.seconds.values())
+        lines.append("{:<48} {:>9} {:>10.2f} {:>12} {:>7.1f}".format(
+            "(chain loop and everything else)", "", other, "", 100 * other / elapsed))
+        lines.append("{} steps in {:.1f} s ({:.1f} steps/s), {} proposals, {} rejected".format(
+            self.steps, elapsed, self.steps / elapsed, self.proposals,
+            sum(self.rejections.values())))
+        for name, count in self.rejections.most_common():
+            lines.append("  rejected by {}: {}".format(name, count))
+        current, peak = memory_mb()
+        lines.append("memory {:.0f} MB (peak {:.0f} MB)".format(current, peak))
+        return "\n".join(lines)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compact binary checkpoints of a running Markov chain.
+
+A checkpoint holds the current district assignment (one small integer per
+node, in graph node order), the step counter, the Python and NumPy random
+states and the next output block number, saved as an .npz file. Nothing
+is pickled, so a checkpoint is a few kilobytes regardless of the updaters
+attached to the partition.
+"""
+import os
+import random
+
+import numpy as np
+
+
+def save_checkpoint(path, partition, step, block):
+    """Atomically write the chain state after ``step`` with ``block`` as the next output block."""
+    nodes = list(partition.graph.nodes)
+    assignment = np.array([partition.assignment[node] for node in nodes])
+    assignment = assignment.astype(np.min_scalar_type(assignment.max()))
+
+    version, mt_state, gauss_next = random.getstate()
+    np_name, np_keys, np_pos, np_has_gauss, np_gauss = np.random.get_state()
+
+    tmp_path = path + ".tmp.npz"
+    np.savez_compressed(
+        tmp_path,
+        nodes=np.array(nodes),
+        assignment=assignment,
+        step=step,
+        block=block,
+        py_version=version,
+        py_state=np.array(mt_state, dtype=np.uint32),
+        py_gauss=np.nan if gauss_next is None else gauss_next,
+        np_name=np_name,
+        np_keys=np_keys,
+        np_pos=np_pos,
+        np_has_gauss=np_has_gauss,
+        np_gauss=np_gauss,
+    )
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path):
+    """Read a checkpoint back as a dict of its fields."""
+    with np.load(path) as data:
+        checkpoint = {key: data[key] for key in data.files}
+    checkpoint["step"] = int(checkpoint["step"])
+    checkpoint["block"] = int(checkpoint["block"])
+    # Maps each node to its district, with plain Python ints for GerryChain
+    checkpoint["assignment"] = dict(zip(checkpoint["nodes"].tolist(),
+                                        checkpoint["assignment"].tolist()))
+    return checkpoint
+
+
+def restore_random_state(checkpoint):
+    # Puts both random number generators back where the checkpoint left them
+    gauss = float(checkpoint["py_gauss"])
+    random.setstate((int(checkpoint["py_version"]),
+                     tuple(int(x) for x in checkpoint["py_state"]),
+                     None if np.isnan(gauss) else gauss))
+    np.random.set_state((str(checkpoint["np_name"]), checkpoint["np_keys"],
+                         int(checkpoint["np_pos"]), int(checkpoint["np_has_gauss"]),
+                         float(checkpoint["np_gauss"])))
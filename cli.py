@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+One command-line entry point for the whole pipeline, driven by a JSON
+config file (see config.py):
+
+    python cli.py preprocess              # MAUP.py: build IL.shp and its artifacts
+    python cli.py run [--resume]          # the ensemble chains (ensemble_runner.py)
+    python cli.py report [--figures]      # summary table of the ensemble vs the enacted plan
+    python cli.py bench [--compare A B]   # bench.py
+
+Every subcommand takes ``--config path`` (default config.json) and any
+number of ``--set section.key=value`` overrides. Heavy libraries
+(gerrychain, geopandas, matplotlib, ...) are only imported by the
+subcommands that use them, so the CLI itself starts at once.
+
+For sweeps, ``python cli.py serve`` starts a local worker that keeps the
+modules imported and the graph loaded, and ``run --worker`` hands the run
+(with its config) to it over a multiprocessing connection instead of
+starting from scratch. The worker makes up a random key when it starts and
+writes it to ``worker.key_file`` (readable by the user only), where
+``run --worker`` and ``stop`` read it:
+
+    python cli.py serve &
+    for tol in 0.02 0.05 0.1; do
+        python cli.py run --worker --set plan.pop_tolerance=$tol \\
+            --set paths.ensemble_dir=ensembles-$tol
+    done
+    python cli.py stop
+"""
+import argparse
+import json
+import os
+import secrets
+import time
+import traceback
+
+from config import apply_config, load_config
+
+# Graphs loaded by this process, by shapefile path and content hash
+_graphs = {}
+
+
+def load_graph(config):
+    """The config's graph, loaded once per shapefile version in this process."""
+    from graph_cache import load_graph as read_graph, shapefile_hash
+
+    path = config["paths"]["shapefile"]
+    key = (os.path.abspath(path), shapefile_hash(path))
+    if key not in _graphs:
+        _graphs.clear()
+        _graphs[key] = read_graph(path)
+    return _graphs[key]
+
+
+def preprocess(config):
+    from MAUP import preprocess as build
+
+    paths = config["paths"]
+    build(paths["population"], paths["vap"], paths["election"], paths["districts"],
+          paths["shapefile"], paths["summary_file"], paths["stage_cache"])
+
+
+def run(config, resume=False):
+    """Run the ensemble chains and return the number of chains, steps per chain and run time."""
+    apply_config(config)
+    from ensemble_runner import run_ensemble, run_until_converged
+
+    start_time = time.time()
+    graph = load_graph(config)
+    settings = config["run"]
+    directory = config["paths"]["ensemble_dir"]
+    n_chains = settings["chains"] or os.cpu_count()
+    steps_per_chain = settings["total_steps"] // n_chains
+    result = {"chains": n_chains}
+    if settings["ess_target"]:
+        diagnostics = run_until_converged(graph, n_chains, settings["ess_target"], steps_per_chain,
+                                          settings["check_every"], settings["master_seed"],
+                                          directory, resume=resume)
+        steps_per_chain = diagnostics["steps"]
+        result["converged"] = diagnostics["converged"]
+    else:
+        run_ensemble(graph, n_chains, steps_per_chain, settings["master_seed"], directory,
+                     resume=resume)
+    result.update(steps_per_chain=steps_per_chain, seconds=time.time() - start_time)
+    return result
+
+
+def report(config, figures=False):
+    """
+    Table of every ensemble column (after the saved burn-in and thinning,
+    when convergence diagnostics exist) with the enacted plan's value and
+    percentile rank; from the online aggregates when ``run.store_rows`` is
+    off.
+    """
+    import numpy as np
+    import pandas as pd
+
+    directory = config["paths"]["ensemble_dir"]
+    if config["run"]["store_rows"]:
+        from convergence import DIAGNOSTICS_FILE, read_converged
+        from ensemble_store import read_ensemble
+
+        ensemble = read_ensemble(directory)
+        enacted = ensemble[(ensemble["chain"] == 0) & (ensemble["step"] == 0)].iloc[0]
+        if os.path.exists(os.path.join(directory, DIAGNOSTICS_FILE)):
+            ensemble = read_converged(directory)
+        columns = [c for c in ensemble.columns if c not in ("chain", "step")]
+        rows = {}
+        for column in columns:
+            values = ensemble[column].to_numpy(dtype=float)
+            rows[column] = {
+                "mean": values.mean(), "std": values.std(ddof=1),
+                "q1": np.quantile(values, 0.01), "median": np.median(values),
+                "q99": np.quantile(values, 0.99), "enacted": enacted[column],
+                # Ties counted half, as in online_stats
+                "percentile_rank": 100 * (np.mean(values < enacted[column])
+                                          + 0.5 * np.mean(values == enacted[column]))}
+        table = pd.DataFrame(rows).T
+        samples = {column: ensemble[column] for column in columns}
+        enacted = enacted[columns]
+    else:
+        from online_stats import read_merged_online_stats
+
+        if not config["run"]["online_stats"]:
+            raise ValueError("nothing to report: run with run.store_rows or run.online_stats on")
+        # Every chain's aggregates, as many chains as run starts
+        n_chains = config["run"]["chains"] or os.cpu_count()
+        stats = read_merged_online_stats(config["paths"]["stats_file"].format(chain)
+                                         for chain in range(n_chains))
+        table = pd.DataFrame({name: aggregate.summary() for name, aggregate in stats.items()}).T
+        samples = None
+    print(table.to_string())
+
+    if figures:
+        import matplotlib.pyplot as plt
+        from online_stats import plot_aggregate
+
+        for column in table.index:
+            title = column.replace("_", " ")
+            if samples is None:
+                plot_aggregate(stats[column], title)
+                continue
+            plt.figure()
+            plt.axvline(x = enacted[column], color = 'r')
+            plt.hist(samples[column], align='left')
+            plt.title(title)
+            plt.show()
+    return table
+
+
+def bench(config, compare=None):
+    import bench as suite
+
+    settings = config["bench"]
+    path = config["paths"]["bench_results"]
+    if compare:
+        print(suite.compare(compare[0], compare[1], path).to_string())
+    else:
+        suite.run_suite(settings["sizes"], settings["graphs"], settings["seed"],
+                        settings["samples"], settings["steps"], path)
+
+
+def _address(config):
+    worker = config["worker"]
+    return (worker["host"], worker["port"]), os.path.expanduser(worker["key_file"])
+
+
+def _write_key(path):
+    # A new random key, readable by this user only
+    key = secrets.token_bytes(32)
+    descriptor = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    # In case the file existed with wider permissions
+    os.fchmod(descriptor, 0o600)
+    with os.fdopen(descriptor, "wb") as f:
+        f.write(key)
+    return key
+
+
+def serve(config):
+    """
+    Answer requests from ``run --worker`` until told to stop, keeping the
+    chain modules imported and the last graph loaded between them.
+    """
+    from multiprocessing.connection import Listener
+    # Imported here once, so that no request pays for it
+    import ensemble_runner
+
+    if os.path.exists(config["paths"]["shapefile"]):
+        load_graph(config)
+    address, key_file = _address(config)
+    with Listener(address, authkey=_write_key(key_file)) as listener:
+        print("worker listening on {}:{}".format(*address))
+        try:
+            while True:
+                with listener.accept() as connection:
+                    request = connection.recv()
+                    if request["command"] == "stop":
+                        connection.send({"result": "stopped"})
+                        return
+                    try:
+                        result = run(request["config"], resume=request.get("resume", False))
+                        connection.send({"result": result})
+                    except Exception:
+                        connection.send({"error": traceback.format_exc()})
+        finally:
+            os.remove(key_file)
+
+
+def send(config, request):
+    """Send a request to the worker and return its result (raising its error, if any)."""
+    from multiprocessing.connection import Client
+
+    address, key_file = _address(config)
+    if not os.path.exists(key_file):
+        raise RuntimeError("no worker key at {}; start the worker with cli.py serve".format(key_file))
+    with open(key_file, "rb") as f:
+        authkey = f.read()
+    with Client(address, authkey=authkey) as connection:
+        connection.send(request)
+        reply = connection.recv()
+    if "error" in reply:
+        raise RuntimeError("worker failed:\n" + reply["error"])
+    return reply["result"]
+
+
+if __name__ == "__main__":
+    # Options every subcommand takes
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--config", default="config.json")
+    common.add_argument("--set", action="append", default=[], metavar="SECTION.KEY=VALUE",
+                        help="override one setting of the config (repeatable)")
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("preprocess", parents=[common],
+                          help="build IL.shp, its district summary and graph artifact")
+    run_parser = subparsers.add_parser("run", parents=[common], help="run the ensemble chains")
+    run_parser.add_argument("--resume", action="store_true",
+                            help="continue every chain from its last checkpoint")
+    run_parser.add_argument("--worker", action="store_true",
+                            help="run in the warm worker started by serve")
+    report_parser = subparsers.add_parser("report", parents=[common], help="summarize the ensemble")
+    report_parser.add_argument("--figures", action="store_true", help="also draw the histograms")
+    bench_parser = subparsers.add_parser("bench", parents=[common],
+                                         help="run or compare the benchmarks")
+    bench_parser.add_argument("--compare", nargs=2, metavar=("BASE", "OTHER"))
+    subparsers.add_parser("serve", parents=[common], help="start a warm worker for run --worker")
+    subparsers.add_parser("stop", parents=[common], help="stop the warm worker")
+    args = parser.parse_args()
+
+    config = load_config(args.config, args.set)
+    if args.command == "preprocess":
+        preprocess(config)
+    elif args.command == "run":
+        if args.worker:
+            result = send(config, {"command": "run", "config": config, "resume": args.resume})
+        else:
+            result = run(config, resume=args.resume)
+        print(json.dumps(result))
+    elif args.command == "report":
+        report(config, args.figures)
+    elif args.command == "bench":
+        bench(config, args.compare)
+    elif args.command == "serve":
+        serve(config)
+    else:
+        print(send(config, {"command": "stop"}))
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Incremental compactness updaters for GerryChain partitions.
+
+``GeographicPartition`` recomputes district areas and perimeters from the
+precinct geometry on every step. Everything those need is already in the
+dual graph (and so in the cached artifact of graph_cache.py): each
+precinct's ``area`` and, for precincts on the state boundary, its exterior
+``boundary_perim``, plus the ``shared_perim`` of every adjacency edge. A
+district's perimeter is the exterior boundary of its precincts plus the
+shared boundary of its cut edges.
+
+These updaters keep every district's area and perimeter as arrays and, on
+each step, only look at the precincts in ``partition.flips`` and their
+edges, so the Polsby-Popper score (4 pi area / perimeter^2) and the
+Schwartzberg score (perimeter over the circumference of the circle of the
+same area) of every district cost about as much as a tally. The full
+recomputation is kept as a verification mode, as in partisan_updaters.py.
+
+Example:
+
+    updaters.update(compactness_updaters("compactness", range(1, 60)))
+    part["compactness_polsby_popper"], part["compactness_mean_polsby_popper"]
+"""
+import math
+from functools import partial
+
+import numpy as np
+
+from fast_recom import csr_graph
+
+
+class CompactnessState:
+    """District index of every node plus the per-district areas and perimeters."""
+
+    __slots__ = ["ids", "area", "perimeter"]
+
+    def copy(self):
+        new = CompactnessState()
+        new.ids = self.ids.copy()
+        new.area = self.area.copy()
+        new.perimeter = self.perimeter.copy()
+        return new
+
+    @property
+    def polsby_popper(self):
+        return 4 * math.pi * self.area / self.perimeter ** 2
+
+    @property
+    def schwartzberg(self):
+        return self.perimeter / (2 * np.sqrt(math.pi * self.area))
+
+    @property
+    def mean_polsby_popper(self):
+        return float(self.polsby_popper.mean())
+
+    @property
+    def min_polsby_popper(self):
+        return float(self.polsby_popper.min())
+
+
+class CompactnessTally:
+    """
+    Updater holding a :class:`CompactnessState`.
+
+    :param districts: The district labels, in a fixed order.
+    :param alias: The name of this updater in the partition's updaters.
+    :param verify: Also run the full recomputation on every step and raise
+        an AssertionError if it disagrees with the incremental result.
+    """
+
+    def __init__(self, districts, alias, verify=False):
+        self.districts = list(districts)
+        self.position = {district: i for i, district in enumerate(self.districts)}
+        self.alias = alias
+        self.verify = verify
+
+    def __call__(self, partition):
+        if partition.parent is None or not partition.flips:
+            return self.full(partition)
+        state = self.update(partition.parent[self.alias], partition)
+        if self.verify:
+            check_compactness(state, self.full(partition), self.alias)
+        return state
+
+    def _arrays(self, partition):
+        csr = csr_graph(getattr(partition.graph, "graph", partition.graph))
+        return (csr, csr.column("area"), csr.column("boundary_perim", default=0.0),
+                csr.edge_column("shared_perim"))
+
+    def full(self, partition):
+        csr, area, boundary, shared = self._arrays(partition)
+        k = len(self.districts)
+        state = CompactnessState()
+        state.ids = np.fromiter((self.position[partition.assignment[node]] for node in csr.nodes),
+                                dtype=np.int64, count=len(csr.nodes))
+        state.area = np.bincount(state.ids, area, minlength=k)
+        # Every cut edge appears once from each side in the CSR arrays and
+        # counts towards the district of the side it is listed under
+        sources = state.ids[np.repeat(np.arange(len(csr.nodes)), np.diff(csr.indptr))]
+        cut = sources != state.ids[csr.indices]
+        state.perimeter = (np.bincount(state.ids, boundary, minlength=k)
+                           + np.bincount(sources[cut], shared[cut], minlength=k))
+        return state
+
+    def update(self, previous, partition):
+        # Moves the moved nodes' area and exterior boundary, then redoes
+        # the shared boundary of every edge at a moved node
+        csr, area, boundary, shared = self._arrays(partition)
+        k = len(self.districts)
+        state = previous.copy()
+        flipped = np.fromiter((csr.position[node] for node in partition.flips), dtype=np.int64)
+        new = np.fromiter((self.position[d] for d in partition.flips.values()), dtype=np.int64)
+        # ReCom's flips include the precincts that stayed in their district
+        moved = new != previous.ids[flipped]
+        flipped, new = flipped[moved], new[moved]
+        old = previous.ids[flipped]
+        state.ids[flipped] = new
+        state.area += np.bincount(new, area[flipped], minlength=k) \
+            - np.bincount(old, area[flipped], minlength=k)
+        state.perimeter += np.bincount(new, boundary[flipped], minlength=k) \
+            - np.bincount(old, boundary[flipped], minlength=k)
+
+        # Edge entries v -> u with v moved, listed under v's district; the
+        # reverse entries u -> v are listed under u's (unchanged) district,
+        # unless u moved too, in which case they are covered from u's row
+        starts = csr.indptr[flipped]
+        lengths = csr.indptr[flipped + 1] - starts
+        entries = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        v = np.repeat(flipped, lengths)
+        u = csr.indices[entries]
+        s = shared[entries]
+        was_cut = previous.ids[v] != previous.ids[u]
+        is_cut = state.ids[v] != state.ids[u]
+        reverse = previous.ids[u] == state.ids[u]
+        state.perimeter += (np.bincount(state.ids[v][is_cut], s[is_cut], minlength=k)
+                            - np.bincount(previous.ids[v][was_cut], s[was_cut], minlength=k)
+                            + np.bincount(state.ids[u][is_cut & reverse], s[is_cut & reverse],
+                                          minlength=k)
+                            - np.bincount(state.ids[u][was_cut & reverse], s[was_cut & reverse],
+                                          minlength=k))
+        return state
+
+
+def check_compactness(incremental, full, name):
+    # Raises if the incremental and full recomputation paths disagree
+    if not (np.array_equal(incremental.ids, full.ids)
+            and np.allclose(incremental.area, full.area, rtol=1e-9, atol=0)
+            and np.allclose(incremental.perimeter, full.perimeter, rtol=1e-9, atol=0)):
+        raise AssertionError(
+            "incremental '{}' disagrees with full recomputation: "
+            "largest area difference {}, largest perimeter difference {}".format(
+                name, np.abs(incremental.area - full.area).max(),
+                np.abs(incremental.perimeter - full.perimeter).max()))
+
+
+def _state_field(alias, field, partition):
+    return getattr(partition[alias], field)
+
+
+def compactness_updaters(name, districts, verify=False):
+    """
+    Return the compactness updaters: ``name`` holds the shared state,
+    ``<name>_polsby_popper`` and ``<name>_schwartzberg`` the per-district
+    scores (in ``districts`` order), and ``<name>_mean_polsby_popper`` and
+    ``<name>_min_polsby_popper`` the plan-wide summaries.
+    """
+    return {
+        name: CompactnessTally(districts, alias=name, verify=verify),
+        name + "_polsby_popper": partial(_state_field, name, "polsby_popper"),
+        name + "_schwartzberg": partial(_state_field, name, "schwartzberg"),
+        name + "_mean_polsby_popper": partial(_state_field, name, "mean_polsby_popper"),
+        name + "_min_polsby_popper": partial(_state_field, name, "min_polsby_popper"),
+    }
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Settings of the whole pipeline in one JSON file, for cli.py.
+
+The file has one section per concern (``paths``, ``plan``, ``run``,
+``bench`` and ``worker``); any key it leaves out keeps its value from
+``DEFAULT_CONFIG``. The scripts take their defaults from ``DEFAULT_CONFIG``
+too, so it is the one place they are set; config.json holds overrides only.
+``apply_config`` pushes the plan and run settings into the modules that
+read them (demwin_ensemble's settings, district_summary.ELECTION_COLUMNS)
+before a run. Only the standard library is imported here, so reading a
+config costs nothing.
+
+Example:
+
+    config = load_config("config.json", ["plan.pop_tolerance=0.05"])
+    apply_config(config)
+"""
+import copy
+import json
+import os
+
+DEFAULT_CONFIG = {
+    "paths": {
+        # Inputs and outputs of MAUP.py
+        "population": "./il_pl2020_b/il_pl2020_p2_b.shp",
+        "vap": "./il_pl2020_b/il_pl2020_p4_b.shp",
+        "election": "./il_vest_20/il_vest_20.shp",
+        "districts": "./il_sldu_2021/il_sldu_2021.shp",
+        "shapefile": "./IL/IL.shp",
+        "summary_file": "./IL/IL_districts.csv",
+        "stage_cache": "./maup_cache",
+        # Outputs of the chains
+        "ensemble_dir": "ensembles",
+        "shares_dir": "shares",
+        "plans_dir": "plans",
+        "stats_file": "ensemble_stats-{:04d}.json",
+        "bench_results": os.path.join("benchmarks", "results.jsonl"),
+    },
+    "plan": {
+        "num_dist": 59,
+        "pop_tolerance": 0.1,
+        # (Democratic, Republican) vote columns of each tracked election
+        "elections": {"pres": ["G20PRED", "G20PRER"], "sen": ["G20USSD", "G20USSR"]},
+    },
+    "run": {
+        # Chains default to one per core; total_steps is split between them
+        "chains": None,
+        "total_steps": 200000,
+        "master_seed": 382946,
+        # Stop early once every tracked statistic has this effective sample size
+        "ess_target": None,
+        "check_every": 5000,
+        "flush_every": 1000,
+        "checkpoint_every": 1000,
+        "record_shares": False,
+        "online_stats": False,
+        "store_rows": True,
+        "archive_plans": False,
+        "keyframe_every": 1000,
+        "profile_every": 0,
+        "verify_metrics": False,
+    },
+    "bench": {
+        "sizes": ["small", "medium"],
+        "graphs": ["grid", "triangulated"],
+        "seed": 2024,
+        "samples": 50,
+        "steps": 500,
+    },
+    "worker": {
+        # Address of the warm worker started by ``cli.py serve``, and the
+        # user-only file holding the random key it makes up at start
+        "host": "localhost",
+        "port": 6071,
+        "key_file": os.path.join("~", ".gerrymandering-worker.key"),
+    },
+}
+
+# demwin_ensemble settings set from each config section, by config key
+MODULE_SETTINGS = {
+    "paths": {"ensemble_dir": "ensemble_dir", "shares_dir": "shares_dir",
+              "plans_dir": "plans_dir", "stats_file": "stats_file",
+              "summary_file": "summary_file"},
+    "plan": {"num_dist": "num_dist", "pop_tolerance": "pop_tolerance"},
+    "run": {name: name for name in ("flush_every", "checkpoint_every", "record_shares",
+                                    "online_stats", "store_rows", "archive_plans",
+                                    "keyframe_every", "profile_every", "verify_metrics")},
+}
+
+
+def merge(base, overrides):
+    """Copy of ``base`` with the (nested) keys of ``overrides`` replaced."""
+    merged = copy.deepcopy(base)
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict) and key != "elections":
+            merged[key] = merge(merged[key], value)
+        else:
+            merged[key] = copy.deepcopy(value)
+    return merged
+
+
+def parse_setting(setting):
+    """``section.key=value`` (the value as JSON, or else as text) as a nested dict."""
+    name, _, text = setting.partition("=")
+    try:
+        value = json.loads(text)
+    except ValueError:
+        value = text
+    keys = name.split(".")
+    for key in reversed(keys):
+        value = {key: value}
+    return value
+
+
+def load_config(path=None, settings=()):
+    """
+    The defaults, overridden by the JSON file at ``path`` (if given and
+    present) and then by each ``section.key=value`` in ``settings``.
+    """
+    config = DEFAULT_CONFIG
+    if path and os.path.exists(path):
+        with open(path) as f:
+            config = merge(config, json.load(f))
+    for setting in settings:
+        config = merge(config, parse_setting(setting))
+    for section, values in config.items():
+        unknown = set(values) - set(DEFAULT_CONFIG.get(section, values))
+        if section not in DEFAULT_CONFIG or unknown:
+            raise KeyError("unknown setting {}".format(
+                section if section not in DEFAULT_CONFIG else section + "." + sorted(unknown)[0]))
+    return config
+
+
+def apply_config(config):
+    """Set the chain modules' settings from ``config`` (every one of them, so runs don't leak)."""
+    import demwin_ensemble
+    import district_summary
+
+    for section, names in MODULE_SETTINGS.items():
+        for key, attribute in names.items():
+            setattr(demwin_ensemble, attribute, config[section][key])
+    elections = {name: tuple(columns) for name, columns in config["plan"]["elections"].items()}
+    if set(elections) != set(district_summary.ELECTION_COLUMNS):
+        raise ValueError("elections must give the columns of exactly {}".format(
+            ", ".join(district_summary.ELECTION_COLUMNS)))
+    # Updated in place, as demwin_ensemble holds a reference to the dict
+    district_summary.ELECTION_COLUMNS.update(elections)
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Convergence diagnostics for the ensemble chains.
+
+The tracked statistics (cut edges, seat counts, efficiency gaps and
+mean-median differences) of every chain are read back from the ensemble
+store as (chains x steps) traces, and for each statistic this module
+computes
+
+- the burn-in, by MSER-5 (the truncation point, in batches of 5 steps,
+  that minimizes the squared standard error of the remaining mean), taken
+  as the largest over chains and statistics;
+- the multi-chain effective sample size, with Geyer's initial monotone
+  sequence over split chains (from each chain's autocovariance, by FFT),
+  and the integrated autocorrelation time;
+- the split-R-hat of the chains.
+
+``diagnose`` gathers these into one JSON-serializable dict, with the
+thinning interval (the largest autocorrelation time, rounded up) and
+whether every statistic reached the ESS target with R-hat under the
+threshold. ensemble_runner.py uses it to stop once the target is reached,
+saving the diagnostics into the ensemble directory, and ``read_converged``
+applies the saved burn-in and thinning when reading the ensemble back.
+
+Example:
+
+    diagnostics = diagnose(traces(read_ensemble("ensembles")), ess_target=1000)
+    diagnostics["converged"], diagnostics["statistics"]["cutedge_ensemble"]["ess"]
+"""
+import json
+import math
+import os
+
+import numpy as np
+
+from ensemble_store import read_ensemble
+
+# Ensemble columns whose convergence is monitored
+TRACKED_COLUMNS = ['cutedge_ensemble', 'pres_demwin_ensemble', 'sen_demwin_ensemble',
+                   'efficiency_gap_pres', 'efficiency_gap_sen',
+                   'mean_median_diff_pres', 'mean_median_diff_sen']
+
+# Diagnostics file kept with the ensemble (the leading underscore keeps it
+# out of the Parquet dataset)
+DIAGNOSTICS_FILE = "_diagnostics.json"
+
+# Steps per batch in MSER-5
+MSER_BATCH = 5
+
+
+def traces(ensemble, columns=TRACKED_COLUMNS):
+    """
+    (chains x steps) array of each column, from an ensemble with chain and
+    step columns. Chains of different lengths (e.g. one stopped early) are
+    cut to the shortest.
+    """
+    ensemble = ensemble.sort_values(["chain", "step"])
+    lengths = ensemble.groupby("chain").size()
+    n_steps = int(lengths.min())
+    ensemble = ensemble.groupby("chain").head(n_steps)
+    return {name: ensemble[name].to_numpy(dtype=float).reshape(len(lengths), n_steps)
+            for name in columns}
+
+
+def autocovariance(x):
+    """Biased autocovariance of every chain (rows of ``x``) at lags 0..steps-1."""
+    x = np.atleast_2d(x)
+    n = x.shape[-1]
+    centered = x - x.mean(axis=-1, keepdims=True)
+    spectrum = np.fft.rfft(centered, n=2 * n)
+    return np.fft.irfft(spectrum * np.conj(spectrum))[..., :n] / n
+
+
+def _split(chains):
+    # Each chain's first and second halves become separate chains
+    half = chains.shape[1] // 2
+    return np.concatenate([chains[:, :half], chains[:, chains.shape[1] - half:]])
+
+
+def split_rhat(chains):
+    """Split-R-hat of (chains x steps) draws (1 for a constant statistic)."""
+    chains = _split(np.atleast_2d(chains))
+    n = chains.shape[1]
+    within = chains.var(axis=1, ddof=1).mean()
+    between = chains.mean(axis=1).var(ddof=1)
+    if within == 0:
+        return 1.0 if between == 0 else math.inf
+    return float(np.sqrt(((n - 1) / n * within + between) / within))
+
+
+def effective_sample_size(chains):
+    """
+    Multi-chain effective sample size of (chains x steps) draws, and the
+    integrated autocorrelation time. A constant statistic counts as fully
+    independent.
+    """
+    chains = _split(np.atleast_2d(chains))
+    m, n = chains.shape
+    within = chains.var(axis=1, ddof=1).mean()
+    var_plus = (n - 1) / n * within + chains.mean(axis=1).var(ddof=1)
+    if var_plus == 0 or n < 4:
+        return float(m * n), 1.0
+
+    rho = 1 - (within - autocovariance(chains).mean(axis=0)) / var_plus
+    rho[0] = 1.0
+    # Geyer's initial monotone sequence: sums of consecutive pairs, kept
+    # while positive and made non-increasing
+    pairs = rho[:n - n % 2].reshape(-1, 2).sum(axis=1)
+    positive = np.flatnonzero(pairs <= 0)
+    pairs = pairs[:positive[0] if len(positive) else len(pairs)]
+    pairs = np.minimum.accumulate(pairs)
+    tau = max(-1 + 2 * pairs.sum(), 1 / np.log10(m * n))
+    return float(m * n / tau), float(tau)
+
+
+def mser_burn_in(x, batch=MSER_BATCH):
+    """MSER-5 truncation point of one chain, in steps (searched over the first half)."""
+    n_batches = len(x) // batch
+    if n_batches < 4:
+        return 0
+    means = np.asarray(x[:n_batches * batch], dtype=float).reshape(n_batches, batch).mean(axis=1)
+    # Mean and variance of the batch means after each truncation point d,
+    # from suffix sums
+    count = np.arange(n_batches, 0, -1)
+    total = np.cumsum(means[::-1])[::-1]
+    total_sq = np.cumsum((means ** 2)[::-1])[::-1]
+    variance = total_sq / count - (total / count) ** 2
+    mser = variance / count
+    d = int(np.argmin(mser[:n_batches // 2]))
+    return d * batch
+
+
+def diagnose(chain_traces, ess_target=None, rhat_threshold=1.01):
+    """
+    Burn-in, thinning, ESS and split-R-hat of every statistic, computed
+    after removing the burn-in. ``converged`` is True when every statistic
+    has at least ``ess_target`` effective samples and R-hat at most
+    ``rhat_threshold``.
+    """
+    first = next(iter(chain_traces.values()))
+    n_chains, n_steps = first.shape
+    burn_in = max(mser_burn_in(chain) for chains in chain_traces.values() for chain in chains)
+
+    statistics = {}
+    for name, chains in chain_traces.items():
+        kept = chains[:, burn_in:]
+        ess, tau = effective_sample_size(kept)
+        statistics[name] = {"ess": ess, "tau": tau, "rhat": split_rhat(kept),
+                            "mean": float(kept.mean()), "std": float(kept.std(ddof=1))}
+
+    converged = all(stat["rhat"] <= rhat_threshold
+                    and (ess_target is None or stat["ess"] >= ess_target)
+                    for stat in statistics.values())
+    return {"chains": n_chains, "steps": n_steps, "burn_in": burn_in,
+            "thin": max(1, math.ceil(max(stat["tau"] for stat in statistics.values()))),
+            "ess_target": ess_target, "rhat_threshold": rhat_threshold,
+            "converged": converged, "statistics": statistics}
+
+
+def write_diagnostics(directory, diagnostics):
+    path = os.path.join(directory, DIAGNOSTICS_FILE)
+    with open(path + ".tmp", "w") as f:
+        json.dump(diagnostics, f, indent=1)
+    os.replace(path + ".tmp", path)
+
+
+def read_diagnostics(directory):
+    with open(os.path.join(directory, DIAGNOSTICS_FILE)) as f:
+        return json.load(f)
+
+
+def read_converged(directory, columns=None):
+    """The ensemble rows left after the saved burn-in, thinned by the saved interval."""
+    diagnostics = read_diagnostics(directory)
+    ensemble = read_ensemble(directory, None if columns is None else ["chain", "step"] + columns)
+    keep = ((ensemble["step"] >= diagnostics["burn_in"])
+            & ((ensemble["step"] - diagnostics["burn_in"]) % diagnostics["thin"] == 0))
+    return ensemble[keep].reset_index(drop=True)
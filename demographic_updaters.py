@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Matrix-valued demographic tally for GerryChain partitions.
+
+GerryChain's ``Tally`` keeps one dict per attribute. ``ColumnTally`` sums
+any number of node attributes at once into a (districts x columns) NumPy
+matrix, copied from the parent partition on every step with only the rows
+of the districts in ``partition.flows`` summed again. Ten demographic
+columns then cost about as much as one Tally.
+
+From the VAP columns MAUP.py writes to IL.shp, ``demographic_updaters``
+counts
+
+- majority-minority districts, where less than half of the VAP is
+  non-Hispanic white (``WVAP``);
+- majority districts and opportunity districts of each group in
+  ``GROUPS``, where the group's share of the VAP is over one half and at
+  least ``opportunity_share`` respectively.
+
+Example:
+
+    updaters.update(demographic_updaters("demographics", range(1, 60)))
+    part["demographics"][:, VAP_COLUMNS.index("HVAP")]
+    part["demographics_majority_minority"], part["demographics_latino_opportunity"]
+"""
+import weakref
+from functools import partial
+
+import numpy as np
+
+from district_summary import VAP_COLUMNS
+from fast_recom import csr_graph
+
+# VAP column of each minority group
+GROUPS = {"latino": "HVAP", "black": "BVAP", "asian": "ASIANVAP"}
+
+# Smallest share of the VAP that makes a district an opportunity district
+# for a group (a common screening threshold, not a legal test)
+opportunity_share = 0.4
+
+
+class ColumnTally:
+    """
+    Updater summing node attributes by district into a (districts x
+    columns) matrix.
+
+    :param columns: The node attributes, in column order.
+    :param districts: The district labels, in row order.
+    :param alias: The name of this updater in the partition's updaters.
+    :param verify: Also run the full recomputation on every step and raise
+        an AssertionError if it disagrees with the incremental result.
+    """
+
+    def __init__(self, columns, districts, alias, verify=False):
+        self.columns = list(columns)
+        self.districts = list(districts)
+        self.position = {district: i for i, district in enumerate(self.districts)}
+        self.alias = alias
+        self.verify = verify
+        # (nodes x columns) matrix of every graph seen, by CSRGraph
+        self._node_values = weakref.WeakKeyDictionary()
+
+    def __call__(self, partition):
+        if partition.parent is None or partition.flows is None:
+            return self.full(partition)
+        matrix = self.update(partition.parent[self.alias], partition)
+        if self.verify:
+            full = self.full(partition)
+            if not np.allclose(matrix, full, rtol=1e-12, atol=0):
+                raise AssertionError(
+                    "incremental '{}' disagrees with full recomputation: largest "
+                    "difference {}".format(self.alias, np.abs(matrix - full).max()))
+        return matrix
+
+    def _values(self, partition):
+        csr = csr_graph(getattr(partition.graph, "graph", partition.graph))
+        if csr not in self._node_values:
+            self._node_values[csr] = np.column_stack([csr.column(c) for c in self.columns])
+        return csr, self._node_values[csr]
+
+    def _district_sum(self, csr, values, nodes):
+        positions = np.fromiter((csr.position[node] for node in nodes), dtype=np.int64,
+                                count=len(nodes))
+        return values[positions].sum(axis=0)
+
+    def full(self, partition):
+        csr, values = self._values(partition)
+        matrix = np.zeros((len(self.districts), len(self.columns)))
+        for district, nodes in partition.parts.items():
+            matrix[self.position[district]] = self._district_sum(csr, values, nodes)
+        return matrix
+
+    def update(self, previous, partition):
+        # Rows of the districts that gained or lost nodes are summed again
+        # from their nodes; every other row is kept
+        csr, values = self._values(partition)
+        matrix = previous.copy()
+        for district in partition.flows:
+            matrix[self.position[district]] = self._district_sum(
+                csr, values, partition.parts[district])
+        return matrix
+
+
+def _column_share(alias, columns, numerator, denominator, partition):
+    # Share of the denominator column in each district (NaN without any).
+    # The column order is bound in, as the tally in partition.updaters may
+    # be wrapped (e.g. by ChainProfiler.instrument)
+    matrix = partition[alias]
+    top = matrix[:, columns.index(numerator)]
+    bottom = matrix[:, columns.index(denominator)]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return top / bottom
+
+
+def _majority_minority(alias, columns, partition):
+    return int(np.count_nonzero(_column_share(alias, columns, "WVAP", "VAP", partition) < 0.5))
+
+
+def _group_districts(alias, columns, column, threshold, strict, partition):
+    shares = _column_share(alias, columns, column, "VAP", partition)
+    return int(np.count_nonzero(shares > threshold if strict else shares >= threshold))
+
+
+def demographic_updaters(name, districts, columns=VAP_COLUMNS, verify=False):
+    """
+    Return the demographic updaters: ``name`` holds the (districts x
+    columns) matrix, ``<name>_majority_minority`` the number of
+    majority-minority districts, and ``<name>_<group>_majority`` and
+    ``<name>_<group>_opportunity`` the number of majority and opportunity
+    districts of each group in ``GROUPS``. ``columns`` must include VAP,
+    WVAP and the groups' columns.
+    """
+    columns = list(columns)
+    updaters = {
+        name: ColumnTally(columns, districts, alias=name, verify=verify),
+        name + "_majority_minority": partial(_majority_minority, name, columns),
+    }
+    for group, column in GROUPS.items():
+        updaters[name + "_" + group + "_majority"] = partial(
+            _group_districts, name, columns, column, 0.5, True)
+        updaters[name + "_" + group + "_opportunity"] = partial(
+            _group_districts, name, columns, column, opportunity_share, False)
+    return updaters
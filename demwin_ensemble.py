@@ -1,201 +1,435 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-import matplotlib.pyplot as plt
 from gerrychain import Graph, Partition, proposals, updaters, constraints, accept, MarkovChain, Election
 from gerrychain.updaters import cut_edges, Tally
 from gerrychain.proposals import recom
 from gerrychain.accept import always_accept
 from functools import partial
+from contextlib import nullcontext
+import argparse
+import os
 import time
 import random
 import numpy as np
 import pandas as pd
+from partisan_updaters import partisan_updaters
+from compactness_updaters import compactness_updaters
+from demographic_updaters import demographic_updaters
+from ensemble_store import EnsembleWriter, read_ensemble
+from checkpoint import save_checkpoint, load_checkpoint, restore_random_state
+from graph_cache import load_graph
+from share_matrix import ShareRecorder
+from district_summary import ELECTIONS, ELECTION_COLUMNS, read_district_summary, baseline_scores
+from fast_recom import fast_recom
+from chain_profiler import ChainProfiler
+from online_stats import OnlineStatsRecorder, integer_edges, read_online_stats, plot_aggregate
+from plan_archive import PlanArchiveRecorder
+from config import DEFAULT_CONFIG
 
-start_time = time.time()
+# Settings of the chain, with their defaults from config.DEFAULT_CONFIG
+# (cli.py sets them from the config file with config.apply_config)
+_plan, _run, _paths = DEFAULT_CONFIG["plan"], DEFAULT_CONFIG["run"], DEFAULT_CONFIG["paths"]
 
-random.seed(382946)
+# Number of districts, allowed deviation from ideal population, and chain length
+num_dist = _plan["num_dist"]
+pop_tolerance = _plan["pop_tolerance"]
+total_steps = _run["total_steps"]
+# Set to True to recompute the partisan metrics from scratch on every step
+# and check them against the incremental updaters
+verify_metrics = _run["verify_metrics"]
 
-# Loads the graph from the shapefile, representing Illinois's districts
-il_graph = Graph.from_file("./IL/IL.shp")
+# Directory the ensemble is streamed to, and how many steps go in each block
+ensemble_dir = _paths["ensemble_dir"]
+flush_every = _run["flush_every"]
+# Set to True to also record every step's sorted district vote shares for
+# both elections (the matrices Boxplots.py draws from), and where to put them.
+# Off by default: the matrices take about 0.5 kB per step and chain
+record_shares = _run["record_shares"]
+shares_dir = _paths["shares_dir"]
+# Where the chain state is checkpointed, and how many steps apart
+checkpoint_file = "checkpoint.npz"
+checkpoint_every = _run["checkpoint_every"]
+# Set to a number of steps to time every phase of the chain (proposal,
+# constraints, updaters, metrics, output) and print a summary that often,
+# plus a full table at the end; 0 leaves the chain uninstrumented
+profile_every = _run["profile_every"]
+# Set to True to fold every step into constant-memory aggregates (fixed-bin
+# histograms, quantile estimates, mean and variance, and the enacted plan's
+# percentile rank) saved to stats_file, formatted with the chain id. With
+# store_rows False as well, no per-step data is kept at all and the
+# figures are drawn from the aggregates.
+online_stats = _run["online_stats"]
+stats_file = _paths["stats_file"]
+store_rows = _run["store_rows"]
+# Set to True to archive every step's plan (as the precincts that moved,
+# with a full assignment every keyframe_every steps) under plans_dir, so
+# any step can be rebuilt later with plan_archive.PlanArchive
+archive_plans = _run["archive_plans"]
+plans_dir = _paths["plans_dir"]
+keyframe_every = _run["keyframe_every"]
+# Per-district totals of the enacted plan written by MAUP.py
+summary_file = _paths["summary_file"]
 
-# Prints the attributes of the first node (for debugging)
-print(il_graph.nodes[0])
+# Per-step values recorded in the ensemble and their stored types
+ENSEMBLE_DTYPES = {'cutedge_ensemble': np.int16,
+                   'pres_demwin_ensemble': np.int16,
+                   'sen_demwin_ensemble': np.int16,
+                   'mean_median_diff_pres': np.float32,
+                   'mean_median_diff_sen': np.float32,
+                   'efficiency_gap_pres': np.float32,
+                   'efficiency_gap_sen': np.float32,
+                   'mean_polsby_popper': np.float32,
+                   'majority_minority_ensemble': np.int16,
+                   'latino_opportunity_ensemble': np.int16,
+                   'black_opportunity_ensemble': np.int16}
+ENSEMBLE_COLUMNS = list(ENSEMBLE_DTYPES)
+# Figure titles of the ensemble columns
+FIGURE_TITLES = {'cutedge_ensemble': 'Cut Edges',
+                 'pres_demwin_ensemble': 'Presidential Elections Won by Democrats',
+                 'sen_demwin_ensemble': 'Senate Elections Won by Democrats',
+                 'mean_median_diff_pres': "Mean-Median Difference for Presidential Election",
+                 'mean_median_diff_sen': "Mean-Median Difference for Senate Election",
+                 'efficiency_gap_pres': "Efficiency Gap for Presidential Election",
+                 'efficiency_gap_sen': "Efficiency Gap for Senate Election",
+                 'mean_polsby_popper': "Mean Polsby-Popper Score of the Districts",
+                 'majority_minority_ensemble': "Majority-Minority Districts",
+                 'latino_opportunity_ensemble': "Latino Opportunity Districts",
+                 'black_opportunity_ensemble': "Black Opportunity Districts"}
 
-# Initializes a partition of the graph with the updaters for the electoral data
-initial_partition = Partition(
-    il_graph,
-    assignment="SSD",
-    updaters={
+
+def make_updaters():
+    my_updaters = {
         "population": Tally("TOTPOP", alias="population"),
         "cut_edges": cut_edges,
-        "dem_pres_votes": Tally("G20PRED", alias="dem_pres_votes"),
-        "rep_pres_votes": Tally("G20PRER", alias="rep_pres_votes"),
-        "dem_sen_votes": Tally("G20USSD", alias="dem_sen_votes"),
-        "rep_sen_votes": Tally("G20USSR", alias="rep_sen_votes")
     }
-)
-# Calculates the total population and ideal population per district
-tot_pop = sum([il_graph.nodes()[v]['TOTPOP'] for v in il_graph.nodes()])
-num_dist = 59 # Number of districts
-ideal_pop = tot_pop/num_dist # Ideal population per district
-pop_tolerance = .1  # Allowed deviation from ideal population
-
-# Defines the parameters for the random walk proposal used in redistricting
-rw_proposal = partial(recom, ## how you choose a next districting plan
-                      pop_col = "TOTPOP", ## What data describes population? 
-                      pop_target = ideal_pop, ## What the target/ideal population is for each district 
-                                              ## (we calculated ideal pop above)
-                      epsilon = pop_tolerance,  ## how far from ideal population you can deviate
-                                              ## (we set pop_tolerance above)
-                      node_repeats = 1 ## number of times to repeat bipartition.  Can increase if you get a BipartitionWarning
-                      )
-
-
-population_constraint = constraints.within_percent_of_ideal_population(
-    initial_partition, 
-    pop_tolerance, 
-    pop_key="population")
-
-#sets up the markov chain
-our_random_walk = MarkovChain(
-    proposal = rw_proposal, 
-    constraints = [population_constraint],
-    accept = always_accept, # Accept every proposed plan that meets the population constraints
-    initial_state = initial_partition, 
-    #20000 times made two graphs with 2 different seeds that looked the same
-    total_steps = 50000) 
-
-#ensembles keeping track of cut edges, number of districts that are majority latino, and num of districts that dems won
-cutedge_ensemble = []
-pres_demwin_ensemble = []
-sen_demwin_ensemble = []
-mean_median_diff_pres = []
-efficiency_gap_pres = []
-mean_median_diff_sen = []
-efficiency_gap_sen = []
-
-
-def mean_median(partition, dem_key, rep_key):
-    # Counts the democratic and republican votes for each district
-    dem_votes = [partition[dem_key][i + 1] for i in range(num_dist)]
-    rep_votes = [partition[rep_key][i + 1] for i in range(num_dist)]
-    
-    # Calculates the vote share for the Democratic party where total votes are non-zero
-    vote_shares = [d / (d + r) for d, r in zip(dem_votes, rep_votes) if d + r > 0]
-    
-    # Calculates the median and mean of these Democratic vote shares
-    median = np.median(vote_shares)
-    mean = np.mean(vote_shares)
-    
-    # Returns the difference between the median and the mean vote share
-    return median - mean
-
-
-def efficiency_gap(partition, dem_key, rep_key):
-    wasted_d = 0  # Initializes the wasted votes for Democrats
-    wasted_r = 0  # Initializes the wasted votes for Republicans
-    
-    # Loops through each district to calculate wasted votes
-    for i in range(num_dist):
-        d_votes = partition[dem_key][i + 1]
-        r_votes = partition[rep_key][i + 1]
-        total_votes = d_votes + r_votes
-        
-        # Calculate wasted votes depending on which party won the district
-        if d_votes > r_votes:
-            wasted_d += d_votes - (total_votes / 2)  # Democrats win, calculates their wasted votes
-            wasted_r += r_votes  # All Republican votes are wasted
-        else:
-            wasted_d += d_votes  # All Democrat votes are wasted
-            wasted_r += r_votes - (total_votes / 2)  # Republicans win, calculates their wasted votes
-            
-    # Calculates and return the efficiency gap, which is normalized by the total votes
-    return (wasted_r - wasted_d) / sum(list(partition[dem_key].values()) + list(partition[rep_key].values()))
-
-
-# Iterates over the partitions generated in the Markov chain
-for part in our_random_walk:
-    cutedge_ensemble.append(len(part["cut_edges"]))
-    # Counts the number of districts won by Democrats in presidential and senatorial elections
-    num_dem_win_sen = 0
-    num_dem_win_pres = 0
-    for i in range(num_dist):
-        if(part["dem_pres_votes"][i+1] > part["rep_pres_votes"][i+1]):
-            num_dem_win_pres  += 1
-    for i in range(num_dist):
-        if(part["dem_sen_votes"][i+1] > part["rep_sen_votes"][i+1]):
-            num_dem_win_sen += 1
-    # Appends the counts to respective lists
-    sen_demwin_ensemble.append(num_dem_win_sen)
-    pres_demwin_ensemble.append(num_dem_win_pres)
-    # Calculates and tracks the mean-median difference and efficiency gap for both elections
-    mm_diff_pres = mean_median(part, "dem_pres_votes", "rep_pres_votes")
-    eg_pres = efficiency_gap(part, "dem_pres_votes", "rep_pres_votes")
-    mm_diff_sen = mean_median(part, "dem_sen_votes", "rep_sen_votes")
-    eg_sen = efficiency_gap(part, "dem_sen_votes", "rep_sen_votes")
-    
-    mean_median_diff_pres.append(mm_diff_pres)
-    efficiency_gap_pres.append(eg_pres)
-    mean_median_diff_sen.append(mm_diff_sen)
-    efficiency_gap_sen.append(eg_sen)
-
-# Plotting the histogram of the cut edges from the ensemble analysis
-plt.figure()
-plt.hist(cutedge_ensemble, align='left')
-plt.title('Cut Edges')
-plt.show()
-
-# Plotting the histogram of the Presidential elections won by Democrats
-plt.figure()
-plt.hist(pres_demwin_ensemble, align='left')
-plt.title('Presidential Elections Won by Democrats')
-plt.show()
-
-# Plotting the histogram of the Senate elections won by Democrats
-plt.figure()
-plt.hist(sen_demwin_ensemble, align='left')
-plt.title('Senate Elections Won by Democrats')
-plt.show()
-
-# Plotting the histogram for the mean-median difference in Presidential elections
-plt.figure()
-plt.hist(mean_median_diff_pres, align='left')
-plt.title("Mean-Median Difference for Presidential Election")
-plt.show()
-
-# Plotting the histogram for the efficiency gap in Presidential elections
-plt.figure()
-plt.hist(efficiency_gap_pres, align='left')
-plt.title("Efficiency Gap for Presidential Election")
-plt.show()
-
-# Plotting the histogram for the mean-median difference in Senate elections
-plt.figure()
-plt.hist(mean_median_diff_sen, align='left')
-plt.title("Mean-Median Difference for Senate Election")
-plt.show()
-
-# Plotting the histogram for the efficiency gap in Senate elections
-plt.figure()
-plt.hist(efficiency_gap_sen, align='left')
-plt.title("Efficiency Gap for Senate Election")
-plt.show()
-
-# Creates a dictionary with ensemble analysis results
-col_names = {'cutedge_ensemble': cutedge_ensemble, 
-             'pres_demwin_ensemble': pres_demwin_ensemble,
-             'sen_demwin_ensemble': sen_demwin_ensemble,
-             'mean_median_diff_pres': mean_median_diff_pres,
-             'mean_median_diff_sen':mean_median_diff_sen,
-             'efficiency_gap_pres': mean_median_diff_pres,
-             'efficiency_gap_sen': efficiency_gap_sen}
-
-# Converts the dictionary to a DataFrame
-ensembles = pd.DataFrame(col_names)
-
-# Saves the DataFrame to a CSV file
-ensembles.to_csv('ensembles.csv')
-
-end_time = time.time()
-print("The time of execution of above program is :",
-      (end_time-start_time)/60, "mins")
\ No newline at end of file
+    # Democratic and Republican vote Tallies of each election ("dem_pres_votes"
+    # from G20PRED, ...), with the columns from district_summary.ELECTION_COLUMNS
+    for name, columns in ELECTION_COLUMNS.items():
+        for key, column in zip(ELECTIONS[name], columns):
+            my_updaters[key] = Tally(column, alias=key)
+    # Seat count, efficiency gap and mean-median updaters ("pres_seats",
+    # "sen_efficiency_gap", ...) that only recompute the districts a step changed
+    for name, (dem_key, rep_key) in ELECTIONS.items():
+        my_updaters.update(partisan_updaters(name, dem_key, rep_key,
+                                             range(1, num_dist + 1), verify=verify_metrics))
+    # District areas and perimeters from the graph's precinct areas and
+    # shared perimeters, giving "compactness_polsby_popper" and friends
+    my_updaters.update(compactness_updaters("compactness", range(1, num_dist + 1),
+                                            verify=verify_metrics))
+    # All VAP columns summed by district in one matrix, with the counts of
+    # majority-minority and opportunity districts read from it
+    my_updaters.update(demographic_updaters("demographics", range(1, num_dist + 1),
+                                            verify=verify_metrics))
+    return my_updaters
+
+
+def make_initial_partition(graph, assignment="SSD"):
+    # Initializes a partition of the graph with the updaters for the electoral data
+    return Partition(
+        graph,
+        assignment=assignment,
+        updaters=make_updaters()
+    )
+
+
+def make_chain(graph, initial_partition, total_steps, plan_partition=None, accept=always_accept):
+    # Sets up the ReCom Markov chain starting from initial_partition. The
+    # population constraint is built from plan_partition (the enacted plan),
+    # which defaults to the initial partition itself. accept replaces the
+    # neutral always_accept for optimization runs (see short_bursts.py).
+    if plan_partition is None:
+        plan_partition = initial_partition
+
+    # Calculates the total population and ideal population per district
+    tot_pop = sum([graph.nodes()[v]['TOTPOP'] for v in graph.nodes()])
+    ideal_pop = tot_pop/num_dist # Ideal population per district
+
+    # Defines the parameters for the random walk proposal used in redistricting
+    # (fast_recom samples the same plans as gerrychain's recom, on arrays)
+    rw_proposal = partial(fast_recom, ## how you choose a next districting plan
+                          pop_col = "TOTPOP", ## What data describes population? 
+                          pop_target = ideal_pop, ## What the target/ideal population is for each district 
+                                                  ## (we calculated ideal pop above)
+                          epsilon = pop_tolerance,  ## how far from ideal population you can deviate
+                                                  ## (we set pop_tolerance above)
+                          node_repeats = 1 ## number of times to repeat bipartition.  Can increase if you get a BipartitionWarning
+                          )
+
+    population_constraint = constraints.within_percent_of_ideal_population(
+        plan_partition, 
+        pop_tolerance, 
+        pop_key="population")
+
+    #sets up the markov chain
+    return MarkovChain(
+        proposal = rw_proposal, 
+        constraints = [population_constraint],
+        accept = accept, # By default, accept every proposed plan that meets the population constraints
+        initial_state = initial_partition, 
+        total_steps = total_steps) 
+
+
+def ensemble_row(part):
+    # Values recorded for one step of the chain, in ENSEMBLE_COLUMNS order
+    return (len(part["cut_edges"]),
+            # Number of districts won by Democrats in presidential and senatorial elections
+            part["pres_seats"], part["sen_seats"],
+            # Mean-median difference and efficiency gap for both elections
+            part["pres_mean_median"], part["sen_mean_median"],
+            part["pres_efficiency_gap"], part["sen_efficiency_gap"],
+            # Mean Polsby-Popper score over the districts
+            part["compactness_mean_polsby_popper"],
+            # Majority-minority, Latino opportunity and Black opportunity districts
+            part["demographics_majority_minority"], part["demographics_latino_opportunity"],
+            part["demographics_black_opportunity"])
+
+
+def online_edges(graph):
+    # Histogram bins of each ensemble column for the online aggregates
+    return {'cutedge_ensemble': integer_edges(0, graph.number_of_edges()),
+            'pres_demwin_ensemble': integer_edges(0, num_dist),
+            'sen_demwin_ensemble': integer_edges(0, num_dist),
+            'mean_median_diff_pres': np.linspace(-0.5, 0.5, 1001),
+            'mean_median_diff_sen': np.linspace(-0.5, 0.5, 1001),
+            'efficiency_gap_pres': np.linspace(-1, 1, 2001),
+            'efficiency_gap_sen': np.linspace(-1, 1, 2001),
+            'mean_polsby_popper': np.linspace(0, 1, 1001),
+            'majority_minority_ensemble': integer_edges(0, num_dist),
+            'latino_opportunity_ensemble': integer_edges(0, num_dist),
+            'black_opportunity_ensemble': integer_edges(0, num_dist)}
+
+
+def run_chain(graph, plan_partition, total_steps, directory, chain_id=0,
+              checkpoint_path=None, resume=False, capacity=None):
+    """
+    Runs the chain from the enacted plan for ``total_steps`` steps (step 0
+    being the plan itself), streaming one row per step to ``directory``.
+
+    The chain runs in segments of ``checkpoint_every`` steps. Each segment
+    starts from a fresh Partition of the current assignment and ends with a
+    flushed output block and a checkpoint, so with ``resume=True`` a run
+    picks up from ``checkpoint_path`` and produces exactly the rows of a run
+    that was never interrupted.
+
+    Besides the ensemble rows, every step goes to the recorders switched on
+    above (e.g. ``record_shares``, ``online_stats``, ``archive_plans``),
+    which are flushed with each checkpoint and rolled back to its step on
+    resume. With ``directory=None`` no rows are written. ``capacity`` is
+    the number of steps the share matrices are allocated for, when a
+    resumed run may go past ``total_steps`` (they grow otherwise).
+    With ``profile_every`` set, each segment's chain is instrumented by a
+    ChainProfiler (see chain_profiler.py).
+    """
+    resume = bool(resume and checkpoint_path and os.path.exists(checkpoint_path))
+    profiler = None
+    if profile_every:
+        # The seat, efficiency gap and mean-median updaters count as metrics
+        profiler = ChainProfiler(profile_every, metric_updaters=[
+            name for name in make_updaters() if name.split("_")[0] in ELECTIONS])
+    output_phase = profiler.phase("output") if profiler else nullcontext()
+    checkpoint = load_checkpoint(checkpoint_path) if resume else None
+    # Every recorder goes back to the checkpoint's step, as they are flushed
+    # just before it is saved
+    resume_step = checkpoint["step"] if resume else None
+    recorders = []
+    if record_shares:
+        recorders.append(ShareRecorder(shares_dir, list(ELECTIONS), capacity or total_steps, num_dist,
+                                       chain=chain_id, resume=resume_step))
+    if online_stats:
+        recorders.append(OnlineStatsRecorder(stats_file.format(chain_id), online_edges(graph),
+                                             ensemble_row, resume=resume_step))
+    if archive_plans:
+        recorders.append(PlanArchiveRecorder(plans_dir, graph, range(1, num_dist + 1), chain=chain_id,
+                                             keyframe_every=keyframe_every, resume=resume_step))
+
+    writer = None
+    if resume:
+        restore_random_state(checkpoint)
+        step = checkpoint["step"]
+        state = make_initial_partition(graph, assignment=checkpoint["assignment"])
+        if directory:
+            writer = EnsembleWriter(directory, ENSEMBLE_DTYPES, chain=chain_id,
+                                    flush_every=flush_every, first_block=checkpoint["block"])
+    else:
+        if checkpoint_path and os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        step = 0
+        state = plan_partition
+        if directory:
+            writer = EnsembleWriter(directory, ENSEMBLE_DTYPES, chain=chain_id,
+                                    flush_every=flush_every)
+            writer.append(step, ensemble_row(state))
+        for recorder in recorders:
+            recorder.record(step, state)
+
+    with writer or nullcontext():
+        while step < total_steps - 1:
+            segment_steps = min(checkpoint_every, total_steps - 1 - step)
+            segment = make_chain(graph, state, segment_steps + 1, plan_partition)
+            if profiler:
+                profiler.instrument(segment)
+            for i, part in enumerate(segment):
+                # The segment's first state is the one the last segment ended on
+                if i == 0:
+                    continue
+                step += 1
+                with output_phase:
+                    if writer:
+                        writer.append(step, ensemble_row(part))
+                    for recorder in recorders:
+                        recorder.record(step, part)
+                if profiler:
+                    profiler.step()
+
+            state = make_initial_partition(graph, assignment=dict(part.assignment))
+            if writer:
+                writer.flush()
+            for recorder in recorders:
+                recorder.flush()
+            if checkpoint_path:
+                save_checkpoint(checkpoint_path, state, step, writer.block if writer else 0)
+
+        for recorder in recorders:
+            recorder.flush()
+
+    if profiler:
+        print(profiler.report())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--resume", action="store_true",
+                        help="continue the chain from " + checkpoint_file)
+    args = parser.parse_args()
+
+    # Only needed for the figures, so it is not imported with the module
+    import matplotlib.pyplot as plt
+
+    start_time = time.time()
+
+    random.seed(_run["master_seed"])
+    np.random.seed(_run["master_seed"])
+
+    # Loads the graph of Illinois's precincts (from the cached artifact of the shapefile)
+    il_graph = load_graph(_paths["shapefile"])
+
+    # Prints the attributes of the first node (for debugging)
+    print(il_graph.nodes[0])
+
+    initial_partition = make_initial_partition(il_graph)
+
+    #ensembles keeping track of cut edges, number of districts that are majority-minority or latino/black opportunity, and num of districts that dems won
+    run_chain(il_graph, initial_partition, total_steps, ensemble_dir if store_rows else None,
+              checkpoint_path=checkpoint_file, resume=args.resume)
+
+    if online_stats:
+        stats = read_online_stats(stats_file.format(0))
+        for name, aggregate in stats.items():
+            print(name, aggregate.summary())
+
+    if online_stats and not store_rows:
+        # Without stored rows the figures are drawn from the online aggregates
+        # (the red lines mark the enacted plan, step 0 of the chain)
+        for name, title in FIGURE_TITLES.items():
+            plot_aggregate(stats[name], title)
+    elif store_rows:
+        ensembles = read_ensemble(ensemble_dir, ENSEMBLE_COLUMNS)
+        cutedge_ensemble = ensembles['cutedge_ensemble']
+        pres_demwin_ensemble = ensembles['pres_demwin_ensemble']
+        sen_demwin_ensemble = ensembles['sen_demwin_ensemble']
+        mean_median_diff_pres = ensembles['mean_median_diff_pres']
+        efficiency_gap_pres = ensembles['efficiency_gap_pres']
+        mean_median_diff_sen = ensembles['mean_median_diff_sen']
+        efficiency_gap_sen = ensembles['efficiency_gap_sen']
+        mean_polsby_popper = ensembles['mean_polsby_popper']
+
+        # The enacted plan's scores, computed from the district summary table
+        # rather than from a Partition, are marked on the histograms below
+        baseline = {}
+        if os.path.exists(summary_file):
+            scores = baseline_scores(read_district_summary(summary_file))
+            baseline = {'pres_demwin_ensemble': scores['pres']['seats'],
+                        'sen_demwin_ensemble': scores['sen']['seats'],
+                        'mean_median_diff_pres': scores['pres']['mean_median'],
+                        'mean_median_diff_sen': scores['sen']['mean_median'],
+                        'efficiency_gap_pres': scores['pres']['efficiency_gap'],
+                        'efficiency_gap_sen': scores['sen']['efficiency_gap']}
+            print("Enacted plan:", baseline)
+
+        # Plotting the histogram of the cut edges from the ensemble analysis
+        plt.figure()
+        plt.hist(cutedge_ensemble, align='left')
+        plt.title('Cut Edges')
+        plt.show()
+
+        # Plotting the histogram of the Presidential elections won by Democrats
+        plt.figure()
+        if 'pres_demwin_ensemble' in baseline:
+            plt.axvline(x = baseline['pres_demwin_ensemble'], color = 'r')
+        plt.hist(pres_demwin_ensemble, align='left')
+        plt.title('Presidential Elections Won by Democrats')
+        plt.show()
+
+        # Plotting the histogram of the Senate elections won by Democrats
+        plt.figure()
+        if 'sen_demwin_ensemble' in baseline:
+            plt.axvline(x = baseline['sen_demwin_ensemble'], color = 'r')
+        plt.hist(sen_demwin_ensemble, align='left')
+        plt.title('Senate Elections Won by Democrats')
+        plt.show()
+
+        # Plotting the histogram for the mean-median difference in Presidential elections
+        plt.figure()
+        if 'mean_median_diff_pres' in baseline:
+            plt.axvline(x = baseline['mean_median_diff_pres'], color = 'r')
+        plt.hist(mean_median_diff_pres, align='left')
+        plt.title("Mean-Median Difference for Presidential Election")
+        plt.show()
+
+        # Plotting the histogram for the efficiency gap in Presidential elections
+        plt.figure()
+        if 'efficiency_gap_pres' in baseline:
+            plt.axvline(x = baseline['efficiency_gap_pres'], color = 'r')
+        plt.hist(efficiency_gap_pres, align='left')
+        plt.title("Efficiency Gap for Presidential Election")
+        plt.show()
+
+        # Plotting the histogram for the mean-median difference in Senate elections
+        plt.figure()
+        if 'mean_median_diff_sen' in baseline:
+            plt.axvline(x = baseline['mean_median_diff_sen'], color = 'r')
+        plt.hist(mean_median_diff_sen, align='left')
+        plt.title("Mean-Median Difference for Senate Election")
+        plt.show()
+
+        # Plotting the histogram for the efficiency gap in Senate elections
+        plt.figure()
+        if 'efficiency_gap_sen' in baseline:
+            plt.axvline(x = baseline['efficiency_gap_sen'], color = 'r')
+        plt.hist(efficiency_gap_sen, align='left')
+        plt.title("Efficiency Gap for Senate Election")
+        plt.show()
+
+        # Plotting the histogram of the mean Polsby-Popper score (the red line
+        # marks the enacted plan)
+        plt.figure()
+        plt.axvline(x = initial_partition["compactness_mean_polsby_popper"], color = 'r')
+        plt.hist(mean_polsby_popper, align='left')
+        plt.title("Mean Polsby-Popper Score of the Districts")
+        plt.show()
+
+        # Plotting the histograms of the majority-minority and opportunity
+        # district counts, with the enacted plan's counts in red
+        enacted_counts = {'majority_minority_ensemble': "demographics_majority_minority",
+                          'latino_opportunity_ensemble': "demographics_latino_opportunity",
+                          'black_opportunity_ensemble': "demographics_black_opportunity"}
+        for column, updater in enacted_counts.items():
+            plt.figure()
+            plt.axvline(x = initial_partition[updater], color = 'r')
+            plt.hist(ensembles[column], align='left')
+            plt.title(FIGURE_TITLES[column])
+            plt.show()
+
+    end_time = time.time()
+    print("The time of execution of above program is :",
+          (end_time-start_time)/60, "mins")
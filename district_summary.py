@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Per-district summary table of the enacted plan.
+
+MAUP.py sums the population, VAP and vote columns of IL.shp by district in
+one groupby and saves the (districts x attributes) table next to the
+shapefile. The ensemble scripts read it back as the enacted plan's baseline
+without rebuilding a Partition, scored by ``partisan_scores``: the seat
+counts, mean-median differences and efficiency gaps of every election at
+once, from (districts x elections) vote arrays or a whole block of steps
+stacked as (steps x districts x elections). The chain itself keeps these
+metrics incrementally (see partisan_updaters.py).
+
+Example:
+
+    summary = read_district_summary("./IL/IL_districts.csv")
+    baseline = baseline_scores(summary)
+    baseline["sen"]["seats"]
+"""
+import numpy as np
+import pandas as pd
+
+from config import DEFAULT_CONFIG
+
+# Columns of IL.shp summed by district
+POPULATION_COLUMNS = ['TOTPOP', 'HISP', 'NH_WHITE', 'NH_BLACK', 'NH_AMIN', 'NH_ASIAN',
+                      'NH_NHPI', 'NH_OTHER', 'NH_2MORE']
+VAP_COLUMNS = ['VAP', 'HVAP', 'WVAP', 'BVAP', 'AMINVAP', 'ASIANVAP', 'NHPIVAP',
+               'OTHERVAP', '2MOREVAP']
+VOTE_COLUMNS = ['G20PRED', 'G20PRER', 'G20USSD', 'G20USSR']
+SUMMARY_COLUMNS = POPULATION_COLUMNS + VAP_COLUMNS + VOTE_COLUMNS
+
+# Vote Tally updaters of each election tracked by the ensemble, in
+# (Democratic, Republican) pairs
+ELECTIONS = {
+    "pres": ("dem_pres_votes", "rep_pres_votes"),
+    "sen": ("dem_sen_votes", "rep_sen_votes"),
+}
+
+# Vote columns of each election in ELECTIONS, in (Democratic, Republican)
+# pairs (config.apply_config replaces them from the config file)
+ELECTION_COLUMNS = {name: tuple(columns)
+                    for name, columns in DEFAULT_CONFIG["plan"]["elections"].items()}
+
+
+def district_summary(df, district_col="SSD", num_dist=None, columns=SUMMARY_COLUMNS):
+    """
+    Sum ``columns`` of the precinct DataFrame by district.
+
+    The result has one row per district, indexed by district number. With
+    ``num_dist`` the index is 1..num_dist, so a district with no precincts
+    shows up as a row of zeros instead of going missing.
+    """
+    summary = df.groupby(district_col)[columns].sum()
+    if num_dist is not None:
+        summary = summary.reindex(range(1, num_dist + 1), fill_value=0)
+    summary.index.name = district_col
+    return summary
+
+
+def write_district_summary(summary, path):
+    summary.to_csv(path)
+
+
+def read_district_summary(path):
+    return pd.read_csv(path, index_col=0)
+
+
+def district_votes(partition, dem_keys, rep_keys, districts):
+    """Return the (districts x elections) Democratic and Republican vote arrays of a partition."""
+    dem = np.empty((len(districts), len(dem_keys)))
+    rep = np.empty((len(districts), len(rep_keys)))
+    for j, (dem_key, rep_key) in enumerate(zip(dem_keys, rep_keys)):
+        dem_tally = partition[dem_key]
+        rep_tally = partition[rep_key]
+        dem[:, j] = [dem_tally[d] for d in districts]
+        rep[:, j] = [rep_tally[d] for d in districts]
+    return dem, rep
+
+
+def vote_shares(dem, rep):
+    # Democratic two-party share, NaN where a district has no votes
+    total = dem + rep
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(total > 0, dem / total, np.nan)
+
+
+def seats(dem, rep):
+    # Number of districts won by Democrats, for each election
+    return np.count_nonzero(dem > rep, axis=-2)
+
+
+def mean_median(dem, rep):
+    # Median minus mean of the Democratic vote share over districts with votes
+    shares = vote_shares(dem, rep)
+    return np.nanmedian(shares, axis=-2) - np.nanmean(shares, axis=-2)
+
+
+def efficiency_gap(dem, rep):
+    # The winner wastes the votes above half of the district total,
+    # the loser wastes every vote (ties count as a Republican win)
+    total = dem + rep
+    dem_won = dem > rep
+    wasted_d = np.where(dem_won, dem - total / 2, dem)
+    wasted_r = np.where(dem_won, rep, rep - total / 2)
+    return (wasted_r.sum(axis=-2) - wasted_d.sum(axis=-2)) / total.sum(axis=-2)
+
+
+def partisan_scores(dem, rep):
+    """
+    Compute every partisan metric for all elections in one batched call.
+
+    ``dem`` and ``rep`` are (districts x elections) arrays, or stacked
+    (steps x districts x elections) blocks. Returns a dict with the seat
+    counts, mean-median differences and efficiency gaps (one value per
+    election, per step) and the district vote-share vectors.
+    """
+    dem = np.asarray(dem, dtype=float)
+    rep = np.asarray(rep, dtype=float)
+    return {
+        "seats": seats(dem, rep),
+        "mean_median": mean_median(dem, rep),
+        "efficiency_gap": efficiency_gap(dem, rep),
+        "vote_shares": vote_shares(dem, rep),
+    }
+
+
+def baseline_scores(summary, elections=ELECTION_COLUMNS):
+    """Partisan scores (see ``partisan_scores``) of the summarized plan, by election."""
+    names = list(elections)
+    dem = np.column_stack([summary[elections[name][0]].to_numpy(dtype=float) for name in names])
+    rep = np.column_stack([summary[elections[name][1]].to_numpy(dtype=float) for name in names])
+    scores = partisan_scores(dem, rep)
+    return {name: {metric: values[j] if values.ndim == 1 else values[:, j]
+                   for metric, values in scores.items()}
+            for j, name in enumerate(names)}
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Runs several independent ReCom chains in a process pool and merges them into
+one ensemble store.
+
+Every chain gets its own seed derived from a single master seed, so a run is
+reproducible from that one number. The Illinois graph is read once in the
+parent process (from the cached graph artifact) and handed to each worker when the pool starts, instead of
+every chain re-reading ./IL/IL.shp. Each chain streams its rows into the
+shared ensemble directory, tagged with ``chain`` and ``step`` (step 0 of
+every chain is the enacted plan), and the directory reads back as one
+merged ensemble.
+"""
+import argparse
+import os
+import random
+import time
+from multiprocessing import Pool
+
+import numpy as np
+
+import demwin_ensemble
+import district_summary
+from config import DEFAULT_CONFIG, MODULE_SETTINGS
+from demwin_ensemble import make_initial_partition, run_chain
+from graph_cache import load_graph
+from ensemble_store import read_ensemble
+from convergence import (TRACKED_COLUMNS, DIAGNOSTICS_FILE, diagnose, traces,
+                         read_diagnostics, write_diagnostics)
+
+# Graph shared by the chains of one worker process, set by _init_worker
+_worker_graph = None
+
+
+def chain_seeds(master_seed, n_chains):
+    # Independent, non-overlapping seeds for each chain from one master seed
+    children = np.random.SeedSequence(master_seed).spawn(n_chains)
+    return [int(child.generate_state(1)[0]) for child in children]
+
+
+def _worker_settings():
+    # The chain settings of this process (e.g. set by config.apply_config),
+    # which spawned workers would not see
+    return ({attribute: getattr(demwin_ensemble, attribute)
+             for names in MODULE_SETTINGS.values() for attribute in names.values()},
+            dict(district_summary.ELECTION_COLUMNS))
+
+
+def _init_worker(graph, settings, elections):
+    global _worker_graph
+    for name, value in settings.items():
+        setattr(demwin_ensemble, name, value)
+    # Updated in place, as demwin_ensemble holds a reference to the dict
+    district_summary.ELECTION_COLUMNS.update(elections)
+    _worker_graph = graph
+
+
+def _run_one(task):
+    chain_id, seed, total_steps, directory, resume, capacity = task
+    random.seed(seed)
+    np.random.seed(seed)
+
+    initial_partition = make_initial_partition(_worker_graph)
+    checkpoint_path = os.path.join(directory, "_checkpoint-{:04d}.npz".format(chain_id))
+    # The checkpoints go in the directory even when no rows are stored
+    rows_directory = directory if demwin_ensemble.store_rows else None
+    run_chain(_worker_graph, initial_partition, total_steps, rows_directory,
+              chain_id=chain_id, checkpoint_path=checkpoint_path, resume=resume,
+              capacity=capacity)
+
+
+def run_ensemble(graph, n_chains, total_steps, master_seed, directory,
+                 processes=None, resume=False):
+    """
+    Runs ``n_chains`` chains of ``total_steps`` steps each, all streaming
+    into the ensemble store at ``directory`` (unless demwin_ensemble's
+    ``store_rows`` is off). Each chain checkpoints into the same directory,
+    and ``resume=True`` continues every chain from its last checkpoint.
+
+    ``processes`` defaults to one worker per core.
+    """
+    os.makedirs(directory, exist_ok=True)
+    seeds = chain_seeds(master_seed, n_chains)
+    tasks = [(chain_id, seed, total_steps, directory, resume, None)
+             for chain_id, seed in enumerate(seeds)]
+    with Pool(processes, initializer=_init_worker, initargs=(graph,) + _worker_settings()) as pool:
+        pool.map(_run_one, tasks, chunksize=1)
+
+
+def run_until_converged(graph, n_chains, ess_target, max_steps, check_every, master_seed,
+                        directory, rhat_threshold=1.01, processes=None, resume=False):
+    """
+    Runs ``n_chains`` chains in rounds of ``check_every`` steps until every
+    tracked statistic has ``ess_target`` effective samples (after burn-in)
+    with split-R-hat at most ``rhat_threshold``, or the chains reach
+    ``max_steps``. Each round resumes the chains from their checkpoints, so
+    the result is the same as one uninterrupted run of that length. The
+    diagnostics of every round are saved in ``directory`` (see
+    convergence.py); the last ones are returned.
+    """
+    if not demwin_ensemble.store_rows:
+        raise ValueError("the convergence checks read the stored rows, so store_rows must be on")
+    os.makedirs(directory, exist_ok=True)
+    seeds = chain_seeds(master_seed, n_chains)
+    steps = min(check_every + 1, max_steps)
+    if resume and os.path.exists(os.path.join(directory, DIAGNOSTICS_FILE)):
+        steps = min(read_diagnostics(directory)["steps"] + check_every, max_steps)
+
+    with Pool(processes, initializer=_init_worker, initargs=(graph,) + _worker_settings()) as pool:
+        while True:
+            tasks = [(chain_id, seed, steps, directory, resume, max_steps)
+                     for chain_id, seed in enumerate(seeds)]
+            pool.map(_run_one, tasks, chunksize=1)
+            resume = True
+
+            ensemble = read_ensemble(directory, ["chain", "step"] + TRACKED_COLUMNS)
+            diagnostics = diagnose(traces(ensemble), ess_target, rhat_threshold)
+            write_diagnostics(directory, diagnostics)
+            print("{} steps: minimum ESS {:.0f}, maximum R-hat {:.3f}, burn-in {}, thin {}".format(
+                steps, min(stat["ess"] for stat in diagnostics["statistics"].values()),
+                max(stat["rhat"] for stat in diagnostics["statistics"].values()),
+                diagnostics["burn_in"], diagnostics["thin"]))
+            if diagnostics["converged"] or steps >= max_steps:
+                return diagnostics
+            steps = min(steps + check_every, max_steps)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--resume", action="store_true",
+                        help="continue every chain from its last checkpoint")
+    parser.add_argument("--ess-target", type=float,
+                        help="run until every tracked statistic has this effective sample size")
+    parser.add_argument("--check-every", type=int, default=DEFAULT_CONFIG["run"]["check_every"],
+                        help="steps per chain between convergence checks")
+    args = parser.parse_args()
+
+    start_time = time.time()
+
+    settings, paths = DEFAULT_CONFIG["run"], DEFAULT_CONFIG["paths"]
+    master_seed = settings["master_seed"]
+    n_chains = os.cpu_count()
+    # Splits the study's total steps evenly over the chains
+    steps_per_chain = settings["total_steps"] // n_chains
+
+    il_graph = load_graph(paths["shapefile"])
+
+    if args.ess_target:
+        # Stops at the ESS target, with the fixed study length as the cap
+        diagnostics = run_until_converged(il_graph, n_chains, args.ess_target, steps_per_chain,
+                                          args.check_every, master_seed, paths["ensemble_dir"],
+                                          resume=args.resume)
+        steps_per_chain = diagnostics["steps"]
+    else:
+        run_ensemble(il_graph, n_chains, steps_per_chain, master_seed, paths["ensemble_dir"],
+                     resume=args.resume)
+
+    end_time = time.time()
+    print("Ran", n_chains, "chains of", steps_per_chain, "steps in",
+          (end_time-start_time)/60, "mins")
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Streaming columnar storage for ensemble results.
+
+Rows are buffered in typed NumPy columns and flushed every ``flush_every``
+steps as a small Parquet file inside the output directory, one file per
+chain and block (``part-<chain>-<block>.parquet``). Each file is written to
+a temporary name and renamed into place, so a crash only loses the steps
+after the last flush, and the directory is always a readable dataset.
+Readers load only the columns they ask for.
+"""
+import glob
+import os
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# Identifier columns written in front of every row
+ID_DTYPES = {"chain": np.int16, "step": np.int32}
+
+
+class EnsembleWriter:
+    """
+    Buffers ensemble rows and writes them out as Parquet blocks.
+
+    :param directory: Output directory (created if missing).
+    :param dtypes: Dict of column name to NumPy dtype, in row order.
+    :param chain: Chain id written with every row.
+    :param flush_every: Number of rows per written block.
+    :param first_block: Number of the first block to write. Blocks already
+        in the directory for this chain from that number on are removed.
+    """
+
+    def __init__(self, directory, dtypes, chain=0, flush_every=1000, first_block=0):
+        self.directory = directory
+        self.dtypes = dict(ID_DTYPES, **dtypes)
+        self.chain = chain
+        self.flush_every = flush_every
+        self.block = first_block
+        self.buffers = {name: np.empty(flush_every, dtype=dtype)
+                        for name, dtype in self.dtypes.items()}
+        self.filled = 0
+
+        os.makedirs(directory, exist_ok=True)
+        for path in chain_blocks(directory, chain):
+            if block_number(path) >= first_block:
+                os.remove(path)
+
+    def append(self, step, row):
+        # row holds the values of the non-id columns, in dtypes order
+        i = self.filled
+        for name, value in zip(self.dtypes, (self.chain, step) + tuple(row)):
+            self.buffers[name][i] = value
+        self.filled += 1
+        if self.filled == self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if not self.filled:
+            return
+        table = pa.table({name: buffer[:self.filled] for name, buffer in self.buffers.items()})
+        path = block_path(self.directory, self.chain, self.block)
+        # Datasets skip names starting with "_", so readers never see a partial file
+        tmp_path = os.path.join(self.directory, "_" + os.path.basename(path))
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, path)
+        self.block += 1
+        self.filled = 0
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def block_path(directory, chain, block):
+    return os.path.join(directory, "part-{:04d}-{:06d}.parquet".format(chain, block))
+
+
+def block_number(path):
+    return int(os.path.basename(path).split("-")[2].split(".")[0])
+
+
+def chain_blocks(directory, chain):
+    # Written blocks of one chain, in order
+    return sorted(glob.glob(os.path.join(directory, "part-{:04d}-*.parquet".format(chain))))
+
+
+def read_ensemble(directory, columns=None):
+    """
+    Reads an ensemble directory into a DataFrame, loading only ``columns``
+    (all of them when None).
+    """
+    dataset = ds.dataset(directory, format="parquet")
+    return dataset.to_table(columns=columns).to_pandas()
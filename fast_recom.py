@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Array-backed ReCom proposal.
+
+``fast_recom`` is a drop-in replacement for GerryChain's ``recom`` (0.3.x)
+with the same arguments. The graph is converted once to contiguous integer
+CSR arrays, and each proposal works on index arrays of the two merged
+districts instead of a networkx subgraph:
+
+1. a cut edge of the partition is chosen uniformly, and its two districts
+   are merged;
+2. a spanning tree of the merged region is drawn as the minimum spanning
+   tree under i.i.d. uniform edge weights (what ``recom``'s Kruskal draw
+   produces), using scipy's sparse MST;
+3. a root is chosen uniformly among the tree nodes of degree > 1, subtree
+   populations are accumulated in one pass over the depth-first order, and
+   the cut is the highest-weight tree edge leaving both sides within
+   ``epsilon`` of ``pop_target``;
+4. the root's side gets the lower district label, the other side the
+   higher one.
+
+These are the same choices ``recom`` makes, so both proposals sample the
+same distribution. Whether a tree has a balanced cut does not depend on the
+root (the test is symmetric in the two sides), so a tree without one is
+redrawn at once; it counts as ``node_repeats`` attempts, as it does in
+``recom``. All randomness comes from Python's ``random`` module, so
+``random.seed`` and the chain checkpoints cover it.
+
+``compare_with_recom`` checks the distribution against ``recom`` on a small
+grid; run this module to do so.
+
+Example:
+
+    proposal = partial(fast_recom, pop_col="TOTPOP", pop_target=ideal_pop,
+                       epsilon=0.1, node_repeats=1)
+"""
+import random
+import warnings
+import weakref
+from collections import Counter
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import depth_first_order, minimum_spanning_tree
+from gerrychain.tree import BipartitionWarning
+
+# Attempts after which recom warns and gives up (bipartition_tree's defaults)
+WARN_ATTEMPTS = 1000
+MAX_ATTEMPTS = 100000
+
+# CSRGraph of every graph proposals have been made on
+_csr_graphs = weakref.WeakKeyDictionary()
+
+
+class CSRGraph:
+    """Integer CSR adjacency and per-column node arrays of a gerrychain Graph."""
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.nodes = list(graph.nodes)
+        self.position = {node: i for i, node in enumerate(self.nodes)}
+        neighbors = [[self.position[u] for u in graph.neighbors(node)] for node in self.nodes]
+        self.indptr = np.zeros(len(self.nodes) + 1, dtype=np.int64)
+        self.indptr[1:] = np.cumsum([len(n) for n in neighbors])
+        self.indices = np.fromiter((j for n in neighbors for j in n), dtype=np.int64,
+                                   count=self.indptr[-1])
+        self._columns = {}
+
+    def column(self, name, default=None):
+        """Node attribute ``name`` as a float array (``default`` where a node lacks it)."""
+        if name not in self._columns:
+            self._columns[name] = np.array(
+                [self.graph.nodes[node][name] if default is None
+                 else self.graph.nodes[node].get(name, default) for node in self.nodes],
+                dtype=float)
+        return self._columns[name]
+
+    def edge_column(self, name):
+        """Edge attribute ``name`` for every entry of ``indices``."""
+        key = ("edge", name)
+        if key not in self._columns:
+            sources = np.repeat(np.arange(len(self.nodes)), np.diff(self.indptr))
+            self._columns[key] = np.array(
+                [self.graph.edges[self.nodes[i], self.nodes[j]][name]
+                 for i, j in zip(sources.tolist(), self.indices.tolist())], dtype=float)
+        return self._columns[key]
+
+    def region_edges(self, region):
+        """Edges (i < j) between nodes of ``region``, in positions local to it."""
+        local = np.full(len(self.nodes), -1, dtype=np.int64)
+        local[region] = np.arange(len(region))
+        starts = self.indptr[region]
+        lengths = self.indptr[region + 1] - starts
+        # Positions of every neighbor of every region node in self.indices
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        neighbor = local[self.indices[offsets + np.arange(lengths.sum())]]
+        source = np.repeat(np.arange(len(region)), lengths)
+        keep = neighbor > source
+        return source[keep], neighbor[keep]
+
+
+def csr_graph(graph):
+    if graph not in _csr_graphs:
+        _csr_graphs[graph] = CSRGraph(graph)
+    return _csr_graphs[graph]
+
+
+def _random_tree(size, source, target, rng):
+    # Minimum spanning tree under uniform random weights, as a symmetric
+    # sparse matrix. Weights are drawn from (0, 1] because scipy treats
+    # zero entries as missing edges.
+    weights = 1.0 - rng.random(len(source))
+    tree = minimum_spanning_tree(csr_matrix((weights, (source, target)), shape=(size, size)))
+    return tree + tree.T
+
+
+def _balanced_cut(tree, populations, pop_target, epsilon, rng):
+    """
+    The subtree side of the chosen cut as local positions, or None when no
+    tree edge leaves both sides balanced.
+    """
+    degree = np.diff(tree.indptr)
+    candidates = np.flatnonzero(degree > 1)
+    root = candidates[rng.integers(len(candidates))]
+    order, parent = depth_first_order(tree, root, directed=False, return_predecessors=True)
+
+    # Subtree populations and sizes, children before parents
+    subtree_pop = populations.copy()
+    subtree_size = np.ones(len(populations), dtype=np.int64)
+    for node, up in zip(order[:0:-1].tolist(), parent[order[:0:-1]].tolist()):
+        subtree_pop[up] += subtree_pop[node]
+        subtree_size[up] += subtree_size[node]
+
+    total = populations.sum()
+    tolerance = pop_target * epsilon
+    nodes = order[1:]
+    balanced = nodes[(np.abs(subtree_pop[nodes] - pop_target) <= tolerance)
+                     & (np.abs(total - subtree_pop[nodes] - pop_target) <= tolerance)]
+    if len(balanced) == 0:
+        return None
+
+    # The highest-weight edge among the balanced ones (each node stands for
+    # the edge to its parent)
+    weights = np.asarray(tree[balanced, parent[balanced]]).ravel()
+    cut = balanced[np.argmax(weights)]
+
+    # In depth-first order a subtree is a contiguous run starting at its root
+    start = np.empty(len(populations), dtype=np.int64)
+    start[order] = np.arange(len(order))
+    return order[start[cut]:start[cut] + subtree_size[cut]]
+
+
+def fast_recom(partition, pop_col, pop_target, epsilon, node_repeats=1):
+    """
+    ReCom proposal on CSR arrays, sampling the same distribution as
+    ``gerrychain.proposals.recom`` with the same arguments.
+
+    :param partition: The current partition.
+    :param pop_col: The node attribute holding the population.
+    :param pop_target: The target population of each district.
+    :param epsilon: Allowed deviation from ``pop_target``, as a fraction of it.
+    :param node_repeats: Number of roots ``recom`` tries on one spanning tree.
+    :returns: The partition with the two districts redrawn.
+    :raises RuntimeError: If no balanced cut is found in ``MAX_ATTEMPTS`` attempts.
+    """
+    # Partitions wrap their graph in a FrozenGraph; the CSR arrays are kept
+    # for the networkx graph inside it, which every partition of a chain shares
+    csr = csr_graph(getattr(partition.graph, "graph", partition.graph))
+    populations = csr.column(pop_col)
+
+    edge = random.choice(tuple(partition["cut_edges"]))
+    parts_to_merge = sorted([partition.assignment.mapping[edge[0]],
+                             partition.assignment.mapping[edge[1]]])
+    region = np.fromiter((csr.position[node] for part in parts_to_merge
+                          for node in partition.parts[part]), dtype=np.int64)
+    source, target = csr.region_edges(region)
+    region_pops = populations[region]
+    rng = np.random.default_rng(random.getrandbits(64))
+
+    attempts = 0
+    while attempts < MAX_ATTEMPTS:
+        tree = _random_tree(len(region), source, target, rng)
+        subtree = _balanced_cut(tree, region_pops, pop_target, epsilon, rng)
+        if subtree is not None:
+            break
+        previous, attempts = attempts, attempts + node_repeats
+        if previous < WARN_ATTEMPTS <= attempts:
+            warnings.warn(
+                f"\nFailed to find a balanced cut after {WARN_ATTEMPTS} attempts.\n",
+                BipartitionWarning,
+            )
+    else:
+        raise RuntimeError(f"Could not find a possible cut after {MAX_ATTEMPTS} attempts.")
+
+    labels = np.full(len(region), parts_to_merge[0], dtype=object)
+    labels[subtree] = parts_to_merge[1]
+    flips = {csr.nodes[i]: label for i, label in zip(region.tolist(), labels.tolist())}
+    return partition.flip(flips)
+
+
+def _grid_partition(rows, columns, districts):
+    # Unit-population grid split into horizontal bands of equal size
+    import networkx as nx
+    from gerrychain import Graph, Partition
+
+    grid = nx.convert_node_labels_to_integers(nx.grid_2d_graph(rows, columns), ordering="sorted")
+    graph = Graph.from_networkx(grid)
+    band = rows * columns // districts
+    for node in graph.nodes:
+        graph.nodes[node]["population"] = 1
+    return Partition(graph, {node: node // band + 1 for node in graph.nodes})
+
+
+def compare_with_recom(rows=4, columns=4, districts=4, epsilon=0.0, samples=20000, seed=2024):
+    """
+    Draw ``samples`` proposals from the same grid partition with ``recom``
+    and with ``fast_recom`` and compare the frequencies of the resulting
+    plans with a chi-squared test.
+
+    Returns the number of distinct plans seen and the test's p-value. Plans
+    seen fewer than 5 times overall are pooled into one category.
+    """
+    from gerrychain.proposals import recom
+    from scipy.stats import chi2_contingency
+
+    partition = _grid_partition(rows, columns, districts)
+    pop_target = rows * columns / districts
+    counts = []
+    for proposal in (recom, fast_recom):
+        random.seed(seed)
+        counts.append(Counter(
+            tuple(sorted(proposal(partition, "population", pop_target, epsilon).assignment.items()))
+            for _ in range(samples)))
+
+    plans = sorted(set(counts[0]) | set(counts[1]))
+    table = np.array([[c[plan] for plan in plans] for c in counts])
+    common = table.sum(axis=0) >= 5
+    table = np.column_stack([table[:, common], table[:, ~common].sum(axis=1)])
+    table = table[:, table.sum(axis=0) > 0]
+    return len(plans), chi2_contingency(table)[1]
+
+
+if __name__ == "__main__":
+    for rows, columns, districts, epsilon in [(4, 4, 4, 0.0), (6, 6, 4, 0.2), (6, 6, 3, 0.1)]:
+        plans, p_value = compare_with_recom(rows, columns, districts, epsilon)
+        print("{}x{} grid, {} districts, epsilon {}: {} plans, chi-squared p = {:.3f}".format(
+            rows, columns, districts, epsilon, plans, p_value))
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cached binary dual graph for the precinct shapefile.
+
+``Graph.from_file`` re-parses the shapefile geometry and recomputes the
+precinct adjacency every time, although the scripts only use the node
+attributes and edges afterwards. ``load_graph`` builds that graph once and
+saves it next to the shapefile as an .npz artifact holding CSR adjacency
+arrays (``indptr``/``indices`` plus the shared perimeter of every edge) and
+one typed array per node attribute. Precinct geometries are left out, as
+nothing downstream reads them from the graph. The artifact name carries a
+content hash of the shapefile's files, so writing a new IL.shp (as MAUP.py
+does) makes the next load rebuild it.
+
+Example:
+
+    graph = load_graph("./IL/IL.shp")
+"""
+import glob
+import hashlib
+import json
+import os
+
+import numpy as np
+from gerrychain import Graph
+
+# Files that make up a shapefile, all of which feed the content hash
+SHAPEFILE_PARTS = (".shp", ".shx", ".dbf", ".prj", ".cpg")
+
+
+def shapefile_hash(shp_path):
+    """
+    SHA-256 of the shapefile's component files.
+
+    The digest is remembered in a small sidecar file together with the
+    files' sizes and modification times, so an unchanged shapefile is not
+    re-read on every load.
+    """
+    base = os.path.splitext(shp_path)[0]
+    parts = [base + ext for ext in SHAPEFILE_PARTS if os.path.exists(base + ext)]
+    stamp = [[os.path.basename(p), os.stat(p).st_size, os.stat(p).st_mtime_ns] for p in parts]
+
+    memo_path = base + ".hash.json"
+    if os.path.exists(memo_path):
+        with open(memo_path) as f:
+            memo = json.load(f)
+        if memo["stamp"] == stamp:
+            return memo["hash"]
+
+    digest = hashlib.sha256()
+    for path in parts:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    content_hash = digest.hexdigest()
+    with open(memo_path, "w") as f:
+        json.dump({"stamp": stamp, "hash": content_hash}, f)
+    return content_hash
+
+
+def artifact_path(shp_path, content_hash):
+    return os.path.splitext(shp_path)[0] + ".graph-{}.npz".format(content_hash[:16])
+
+
+def _column(values):
+    # Typed array for one node attribute: numbers stay numeric (missing
+    # values become NaN), anything else is stored as fixed-width text
+    array = np.array(values)
+    if array.dtype.kind in "biuf":
+        return array
+    if all(v is None or isinstance(v, (int, float, np.number)) for v in values):
+        return np.array([np.nan if v is None else v for v in values], dtype=float)
+    return np.array(["" if v is None else str(v) for v in values])
+
+
+def save_graph(graph, path, content_hash=""):
+    """Write a graph as CSR adjacency arrays plus typed attribute columns."""
+    nodes = list(graph.nodes)
+    position = {node: i for i, node in enumerate(nodes)}
+
+    neighbors = [sorted(position[u] for u in graph.neighbors(node)) for node in nodes]
+    indptr = np.zeros(len(nodes) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(n) for n in neighbors])
+    indices = np.fromiter((j for n in neighbors for j in n), dtype=np.int32, count=indptr[-1])
+    shared_perim = np.array([graph.edges[node, nodes[j]].get("shared_perim", np.nan)
+                             for node, n in zip(nodes, neighbors) for j in n], dtype=float)
+
+    arrays = {"nodes": np.array(nodes), "indptr": indptr, "indices": indices,
+              "shared_perim": shared_perim, "hash": np.array(content_hash)}
+
+    # Some attributes (e.g. boundary_perim) only exist on some nodes, so
+    # each column keeps a mask of the nodes that have it
+    names = sorted({name for node in nodes for name in graph.nodes[node]} - {"geometry"})
+    for name in names:
+        present = np.array([name in graph.nodes[node] for node in nodes])
+        fill = next(graph.nodes[node][name] for node in nodes if name in graph.nodes[node])
+        fill = 0 if isinstance(fill, (int, float, np.number)) else ""
+        arrays["node__" + name] = _column([graph.nodes[node].get(name, fill) for node in nodes])
+        if not present.all():
+            arrays["present__" + name] = present
+
+    tmp_path = path + ".tmp.npz"
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+
+
+def read_graph(path):
+    """Rebuild a gerrychain Graph from a saved artifact."""
+    with np.load(path) as data:
+        nodes = data["nodes"].tolist()
+        indptr, indices = data["indptr"], data["indices"]
+        shared_perim = data["shared_perim"].tolist()
+        columns = {key[len("node__"):]: data[key].tolist()
+                   for key in data.files if key.startswith("node__")}
+        present = {key[len("present__"):]: data[key]
+                   for key in data.files if key.startswith("present__")}
+
+    graph = Graph()
+    names = list(columns)
+    for i, row in enumerate(zip(*columns.values())):
+        attributes = dict(zip(names, row))
+        for name, mask in present.items():
+            if not mask[i]:
+                del attributes[name]
+        graph.add_node(nodes[i], **attributes)
+
+    # Each undirected edge appears twice in the CSR arrays; add it once
+    sources = np.repeat(np.arange(len(nodes)), np.diff(indptr))
+    graph.add_edges_from(
+        (nodes[i], nodes[j], {"shared_perim": shared_perim[k]})
+        for k, (i, j) in enumerate(zip(sources.tolist(), indices.tolist())) if i < j)
+    return graph
+
+
+def build_graph_artifact(shp_path):
+    """(Re)build the artifact for the shapefile's current contents and return its path."""
+    content_hash = shapefile_hash(shp_path)
+    path = artifact_path(shp_path, content_hash)
+    # Artifacts of older versions of the shapefile are no longer needed
+    for old in glob.glob(os.path.splitext(shp_path)[0] + ".graph-*.npz"):
+        if old != path:
+            os.remove(old)
+    save_graph(Graph.from_file(shp_path), path, content_hash)
+    return path
+
+
+def load_graph(shp_path):
+    """Load the dual graph of a shapefile, building the artifact first if it is missing or stale."""
+    path = artifact_path(shp_path, shapefile_hash(shp_path))
+    if not os.path.exists(path):
+        path = build_graph_artifact(shp_path)
+    return read_graph(path)
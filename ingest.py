@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+GeoParquet ingestion for the census and VEST shapefiles.
+
+Each source shapefile is converted once to a GeoParquet file next to it,
+read with arrow-backed I/O (pyogrio with ``use_arrow=True`` when available).
+The content hash of the shapefile is stored in the Parquet metadata, so a
+changed source is converted again on the next read. Later reads load only
+the requested columns plus the geometry.
+
+Example:
+
+    blocks = read_columns("./il_pl2020_b/il_pl2020_p2_b.shp", ["P0020001"])
+"""
+import os
+
+import geopandas as gpd
+import pyarrow.parquet as pq
+
+from graph_cache import shapefile_hash
+
+# Parquet metadata key holding the hash of the shapefile a file came from
+SOURCE_HASH_KEY = b"source_hash"
+
+
+def parquet_path(shp_path):
+    return os.path.splitext(shp_path)[0] + ".parquet"
+
+
+def _read_shapefile(shp_path):
+    try:
+        return gpd.read_file(shp_path, engine="pyogrio", use_arrow=True)
+    except (ImportError, TypeError, ValueError):
+        # Older geopandas or pyogrio builds without arrow support
+        return gpd.read_file(shp_path)
+
+
+def to_geoparquet(shp_path):
+    """Convert a shapefile to GeoParquet unless an up-to-date copy exists; return its path."""
+    path = parquet_path(shp_path)
+    source_hash = shapefile_hash(shp_path).encode()
+    if os.path.exists(path):
+        metadata = pq.read_schema(path).metadata or {}
+        if metadata.get(SOURCE_HASH_KEY) == source_hash:
+            return path
+
+    df = _read_shapefile(shp_path)
+    tmp_path = os.path.join(os.path.dirname(path), "_" + os.path.basename(path))
+    df.to_parquet(tmp_path)
+    # Tags the file with the source hash, keeping the geo metadata geopandas wrote
+    table = pq.read_table(tmp_path)
+    metadata = dict(table.schema.metadata or {})
+    metadata[SOURCE_HASH_KEY] = source_hash
+    table = table.replace_schema_metadata(metadata)
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+
+def read_columns(shp_path, columns=None, exclude=()):
+    """
+    Read a shapefile's attributes through its GeoParquet copy, loading only
+    ``columns`` (every column when None) minus ``exclude``, plus the geometry.
+    """
+    path = to_geoparquet(shp_path)
+    if columns is None:
+        columns = [name for name in pq.read_schema(path).names if not name.startswith("__")]
+    columns = [name for name in columns if name not in exclude and name != "geometry"]
+    return gpd.read_parquet(path, columns=columns + ["geometry"])
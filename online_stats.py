@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Constant-memory summaries of the ensemble metrics.
+
+For very long chains the per-step rows need not be kept at all: every
+metric is folded into a ``MetricAggregate`` as the chain runs, holding
+
+- a histogram over fixed bins (plus counts below and above them),
+- streaming quantile estimates (the P-squared algorithm of Jain and
+  Chlamtac, five markers per quantile),
+- the running mean and variance (Welford's method),
+- the enacted plan's value and how many ensemble plans fall below and at
+  it, which gives its percentile rank.
+
+Memory depends on the number of bins, not on the chain length.
+``OnlineStatsRecorder`` plugs into demwin_ensemble.run_chain like the share
+recorder, saving the aggregates as JSON at every checkpoint (and reloading
+those of the checkpoint's step on resume). ``read_merged_online_stats``
+combines the aggregates of several chains, and ``plot_aggregate`` draws a
+prettyhistograms.py-style histogram from an aggregate.
+
+Example:
+
+    stats = read_online_stats("ensemble_stats.json")
+    stats["sen_demwin_ensemble"].percentile_rank()
+    plot_aggregate(stats["sen_demwin_ensemble"], "Senate Elections Won by Democrats")
+"""
+import json
+import math
+import os
+
+import numpy as np
+
+
+class P2Quantile:
+    """Streaming estimate of the ``p`` quantile from five markers."""
+
+    def __init__(self, p):
+        self.p = p
+        self.count = 0
+        self.heights = []
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired = [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]
+        self.increments = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def update(self, x):
+        self.count += 1
+        q = self.heights
+        if self.count <= 5:
+            q.append(x)
+            q.sort()
+            return
+
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= q[k + 1]:
+                k += 1
+        n = self.positions
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+
+        # Moves the middle markers towards their desired positions
+        for i in (1, 2, 3):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                parabolic = q[i] + d / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+                    + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+                if q[i - 1] < parabolic < q[i + 1]:
+                    q[i] = parabolic
+                else:
+                    q[i] += d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                n[i] += d
+
+    def value(self):
+        if self.count == 0:
+            return math.nan
+        if self.count <= 5:
+            return float(np.quantile(self.heights, self.p))
+        return self.heights[2]
+
+    def to_dict(self):
+        return {"p": self.p, "count": self.count, "heights": self.heights,
+                "positions": self.positions, "desired": self.desired}
+
+    @classmethod
+    def from_dict(cls, state):
+        estimate = cls(state["p"])
+        estimate.count = state["count"]
+        estimate.heights = state["heights"]
+        estimate.positions = state["positions"]
+        estimate.desired = state["desired"]
+        return estimate
+
+
+class MetricAggregate:
+    """
+    Histogram, quantile sketches, mean and variance of one metric, and the
+    enacted plan's standing in it.
+
+    :param edges: Fixed, increasing histogram bin edges.
+    :param quantiles: Quantiles to estimate.
+    """
+
+    def __init__(self, edges, quantiles=(0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99)):
+        self.edges = np.asarray(edges, dtype=float)
+        self.counts = np.zeros(len(self.edges) - 1, dtype=np.int64)
+        self.below = 0
+        self.above = 0
+        self.sketches = [P2Quantile(q) for q in quantiles]
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.minimum = math.inf
+        self.maximum = -math.inf
+        self.enacted = None
+        self.less = 0
+        self.equal = 0
+        # Number of chains merged into this aggregate, each of which starts
+        # at the enacted plan
+        self.chains = 1
+
+    def update(self, x):
+        x = float(x)
+        if math.isnan(x):
+            return
+        # Bins are closed on the left; the last one also includes its right edge
+        i = int(np.searchsorted(self.edges, x, side="right")) - 1
+        if x == self.edges[-1]:
+            i -= 1
+        if i < 0:
+            self.below += 1
+        elif i >= len(self.counts):
+            self.above += 1
+        else:
+            self.counts[i] += 1
+
+        for sketch in self.sketches:
+            sketch.update(x)
+
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+        self.minimum = min(self.minimum, x)
+        self.maximum = max(self.maximum, x)
+
+        if self.enacted is None:
+            self.enacted = x
+        elif x < self.enacted:
+            self.less += 1
+        elif x == self.enacted:
+            self.equal += 1
+
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else math.nan
+
+    def histogram_quantile(self, p):
+        """The ``p`` quantile interpolated within the histogram's bins (clamped to the min and max)."""
+        if self.count == 0:
+            return math.nan
+        # Values counted before each bin and after the last one
+        before = self.below + np.concatenate([[0], np.cumsum(self.counts)])
+        target = p * self.count
+        if target <= self.below:
+            return self.minimum
+        if target >= before[-1]:
+            return self.maximum
+        i = int(np.searchsorted(before, target, side="right")) - 1
+        value = self.edges[i] + (target - before[i]) / self.counts[i] * (self.edges[i + 1] - self.edges[i])
+        return float(min(max(value, self.minimum), self.maximum))
+
+    def quantiles(self):
+        if self.chains > 1:
+            # P-squared markers of different chains cannot be combined
+            return {sketch.p: self.histogram_quantile(sketch.p) for sketch in self.sketches}
+        return {sketch.p: sketch.value() for sketch in self.sketches}
+
+    def percentile_rank(self):
+        """Percent of the ensemble (after the enacted plan) below the enacted value, ties counted half."""
+        n = self.count - self.chains
+        if n <= 0:
+            return math.nan
+        return 100 * (self.less + 0.5 * self.equal) / n
+
+    def summary(self):
+        return {"count": self.count, "mean": self.mean, "std": math.sqrt(self.variance()),
+                "min": self.minimum, "max": self.maximum, "enacted": self.enacted,
+                "percentile_rank": self.percentile_rank(),
+                **{"q{:g}".format(100 * p): v for p, v in self.quantiles().items()}}
+
+    def to_dict(self):
+        return {"edges": self.edges.tolist(), "counts": self.counts.tolist(),
+                "below": self.below, "above": self.above,
+                "sketches": [sketch.to_dict() for sketch in self.sketches],
+                "count": self.count, "mean": self.mean, "m2": self.m2,
+                "minimum": self.minimum, "maximum": self.maximum,
+                "enacted": self.enacted, "less": self.less, "equal": self.equal,
+                "chains": self.chains}
+
+    @classmethod
+    def from_dict(cls, state):
+        aggregate = cls(state["edges"], quantiles=())
+        aggregate.counts = np.array(state["counts"], dtype=np.int64)
+        aggregate.sketches = [P2Quantile.from_dict(s) for s in state["sketches"]]
+        for name in ("below", "above", "count", "mean", "m2", "minimum", "maximum",
+                     "enacted", "less", "equal", "chains"):
+            setattr(aggregate, name, state[name])
+        return aggregate
+
+    @classmethod
+    def merged(cls, aggregates):
+        """
+        One aggregate of several chains' aggregates of the same metric (with
+        the same bins and enacted plan). Its quantiles come from the merged
+        histogram, see ``quantiles``.
+        """
+        aggregates = list(aggregates)
+        first = aggregates[0]
+        merged = cls.from_dict(first.to_dict())
+        for other in aggregates[1:]:
+            if not np.array_equal(merged.edges, other.edges) or merged.enacted != other.enacted:
+                raise ValueError("only aggregates with the same bins and enacted value merge")
+            merged.counts += other.counts
+            merged.below += other.below
+            merged.above += other.above
+            # Chan et al.'s pairwise update of the mean and squared deviations
+            count = merged.count + other.count
+            delta = other.mean - merged.mean
+            if count:
+                merged.m2 += other.m2 + delta ** 2 * merged.count * other.count / count
+                merged.mean += delta * other.count / count
+            merged.count = count
+            merged.minimum = min(merged.minimum, other.minimum)
+            merged.maximum = max(merged.maximum, other.maximum)
+            merged.less += other.less
+            merged.equal += other.equal
+            merged.chains += other.chains
+        return merged
+
+
+def integer_edges(low, high):
+    # One bin per integer value from low to high
+    return np.arange(low, high + 2) - 0.5
+
+
+def write_online_stats(path, aggregates, steps=None):
+    """Atomically save the aggregates (and the number of steps folded into them)."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"steps": steps,
+                   "aggregates": {name: aggregate.to_dict()
+                                  for name, aggregate in aggregates.items()}}, f)
+    os.replace(tmp_path, path)
+
+
+def _read_saved(path):
+    # Number of steps and aggregates of a saved file
+    with open(path) as f:
+        saved = json.load(f)
+    return saved["steps"], {name: MetricAggregate.from_dict(state)
+                            for name, state in saved["aggregates"].items()}
+
+
+def read_online_stats(path):
+    return _read_saved(path)[1]
+
+
+def read_merged_online_stats(paths):
+    """The aggregates saved at every path in ``paths`` (one per chain), merged by metric."""
+    chains = [read_online_stats(path) for path in paths]
+    return {name: MetricAggregate.merged(stats[name] for stats in chains) for name in chains[0]}
+
+
+def previous_path(path):
+    # The aggregates of the flush before the last one
+    return path + ".prev"
+
+
+class OnlineStatsRecorder:
+    """
+    Folds every step's ensemble row into one MetricAggregate per column.
+
+    Aggregates cannot be rolled back, so each flush keeps the aggregates of
+    the flush before it too: recorders are flushed just before the chain's
+    checkpoint is saved, so one of the two matches the last checkpoint
+    even if the run stopped in between.
+
+    :param path: JSON file the aggregates are saved to on every flush.
+    :param edges: Histogram bin edges of each column, in row order.
+    :param row: Function returning a step's values from its partition.
+    :param resume: Step of the checkpoint to continue from, with the
+        aggregates saved at ``path`` up to that step; None to start over.
+    """
+
+    def __init__(self, path, edges, row, resume=None):
+        self.path = path
+        self.row = row
+        if resume is not None:
+            for saved_path in (path, previous_path(path)):
+                if os.path.exists(saved_path):
+                    steps, aggregates = _read_saved(saved_path)
+                    if steps == resume + 1:
+                        break
+            else:
+                raise ValueError("no aggregates of {} saved at step {}".format(path, resume))
+            self.aggregates = aggregates
+            # Drops aggregates saved past the checkpoint
+            write_online_stats(path, aggregates, steps)
+            self.steps = self.flushed = steps
+        else:
+            self.aggregates = {name: MetricAggregate(e) for name, e in edges.items()}
+            self.steps = 0
+            self.flushed = None
+
+    def record(self, step, part):
+        for aggregate, value in zip(self.aggregates.values(), self.row(part)):
+            aggregate.update(value)
+        self.steps = step + 1
+
+    def flush(self):
+        if self.flushed is not None and self.flushed != self.steps:
+            os.replace(self.path, previous_path(self.path))
+        write_online_stats(self.path, self.aggregates, self.steps)
+        self.flushed = self.steps
+
+
+def plot_aggregate(aggregate, title, max_bars=40):
+    """
+    Histogram of an aggregate in the style of prettyhistograms.py: the
+    occupied bins (merged down to at most ``max_bars``) and a red line at
+    the enacted plan's value.
+    """
+    import matplotlib.pyplot as plt
+
+    occupied = np.flatnonzero(aggregate.counts)
+    plt.figure()
+    if len(occupied):
+        counts = aggregate.counts[occupied[0]:occupied[-1] + 1]
+        # Merges runs of adjacent bins (the bins are evenly spaced)
+        merge = -(-len(counts) // max_bars)
+        counts = np.pad(counts, (0, -len(counts) % merge)).reshape(-1, merge).sum(axis=1)
+        width = merge * (aggregate.edges[1] - aggregate.edges[0])
+        edges = aggregate.edges[occupied[0]] + width * np.arange(len(counts) + 1)
+        plt.stairs(counts, edges, fill=True)
+    if aggregate.enacted is not None:
+        plt.axvline(x = aggregate.enacted, color = 'r', label = 'axvline - full height')
+    plt.title(title)
+    plt.show()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Incremental partisan metric updaters for GerryChain partitions.
+
+A ReCom step only redraws two districts, so these updaters start from the
+parent partition's cached result and only redo the wasted-vote and win
+bookkeeping for the districts that appear in ``partition.flows``. The full
+recomputation is kept as a verification mode that checks both paths agree.
+
+Example:
+
+    updaters.update(partisan_updaters("pres", "dem_pres_votes",
+                                      "rep_pres_votes", range(1, 60)))
+    part["pres_efficiency_gap"], part["pres_seats"], part["pres_mean_median"]
+"""
+from functools import partial
+
+import numpy as np
+
+
+class PartisanState:
+    """Per-district vote arrays plus the running sums the metrics need."""
+
+    __slots__ = ["dem", "rep", "wasted_d", "wasted_r", "shares",
+                 "wasted_d_sum", "wasted_r_sum", "total_votes", "seats"]
+
+    def copy(self):
+        new = PartisanState()
+        for name in ("dem", "rep", "wasted_d", "wasted_r", "shares"):
+            setattr(new, name, getattr(self, name).copy())
+        new.wasted_d_sum = self.wasted_d_sum
+        new.wasted_r_sum = self.wasted_r_sum
+        new.total_votes = self.total_votes
+        new.seats = self.seats
+        return new
+
+    @property
+    def efficiency_gap(self):
+        return (self.wasted_r_sum - self.wasted_d_sum) / self.total_votes
+
+    @property
+    def mean_median(self):
+        # Districts without votes have a NaN share and are left out
+        return float(np.nanmedian(self.shares) - np.nanmean(self.shares))
+
+
+def _district_metrics(d, r):
+    # Wasted votes, Democratic share and Democratic win for one district
+    total = d + r
+    share = d / total if total > 0 else np.nan
+    if d > r:
+        return d - total / 2, r, share, 1
+    return d, r - total / 2, share, 0
+
+
+class PartisanTally:
+    """
+    Updater holding a :class:`PartisanState` for one election.
+
+    :param dem_key: Updater name of the Democratic vote Tally.
+    :param rep_key: Updater name of the Republican vote Tally.
+    :param districts: The district labels, in a fixed order.
+    :param alias: The name of this updater in the partition's updaters.
+    :param verify: Also run the full recomputation on every step and raise
+        an AssertionError if it disagrees with the incremental result.
+    """
+
+    def __init__(self, dem_key, rep_key, districts, alias, verify=False):
+        self.dem_key = dem_key
+        self.rep_key = rep_key
+        self.districts = list(districts)
+        self.position = {district: i for i, district in enumerate(self.districts)}
+        self.alias = alias
+        self.verify = verify
+
+    def __call__(self, partition):
+        if partition.parent is None or partition.flows is None:
+            return self.full(partition)
+        state = self.update(partition.parent[self.alias], partition)
+        if self.verify:
+            check_states(state, self.full(partition), self.alias)
+        return state
+
+    def full(self, partition):
+        # Recomputes every district from the vote tallies
+        state = PartisanState()
+        dem_tally = partition[self.dem_key]
+        rep_tally = partition[self.rep_key]
+        state.dem = np.array([dem_tally[d] for d in self.districts], dtype=float)
+        state.rep = np.array([rep_tally[d] for d in self.districts], dtype=float)
+        rows = [_district_metrics(d, r) for d, r in zip(state.dem, state.rep)]
+        state.wasted_d, state.wasted_r, state.shares, won = (
+            np.array(column, dtype=float) for column in zip(*rows))
+        state.wasted_d_sum = state.wasted_d.sum()
+        state.wasted_r_sum = state.wasted_r.sum()
+        state.total_votes = state.dem.sum() + state.rep.sum()
+        state.seats = int(won.sum())
+        return state
+
+    def update(self, previous, partition):
+        # Only the districts that gained or lost precincts are touched. Wasted
+        # votes are multiples of one half, so the running sums stay exact.
+        state = previous.copy()
+        dem_tally = partition[self.dem_key]
+        rep_tally = partition[self.rep_key]
+        for district in partition.flows:
+            i = self.position[district]
+            old_d, old_r = state.dem[i], state.rep[i]
+            new_d, new_r = float(dem_tally[district]), float(rep_tally[district])
+            wasted_d, wasted_r, share, won = _district_metrics(new_d, new_r)
+            state.wasted_d_sum += wasted_d - state.wasted_d[i]
+            state.wasted_r_sum += wasted_r - state.wasted_r[i]
+            state.total_votes += new_d + new_r - old_d - old_r
+            state.seats += won - int(old_d > old_r)
+            state.dem[i], state.rep[i] = new_d, new_r
+            state.wasted_d[i], state.wasted_r[i] = wasted_d, wasted_r
+            state.shares[i] = share
+        return state
+
+
+def check_states(incremental, full, name):
+    # Raises if the incremental and full recomputation paths disagree
+    if incremental.seats != full.seats or not np.allclose(
+            [incremental.efficiency_gap, incremental.mean_median],
+            [full.efficiency_gap, full.mean_median], rtol=0, atol=1e-12):
+        raise AssertionError(
+            "incremental '{}' disagrees with full recomputation: "
+            "seats {} vs {}, efficiency gap {} vs {}, mean-median {} vs {}".format(
+                name, incremental.seats, full.seats,
+                incremental.efficiency_gap, full.efficiency_gap,
+                incremental.mean_median, full.mean_median))
+
+
+def _state_field(alias, field, partition):
+    return getattr(partition[alias], field)
+
+
+def partisan_updaters(name, dem_key, rep_key, districts, verify=False):
+    """
+    Return the updaters for one election: ``name`` holds the shared state,
+    and ``<name>_seats``, ``<name>_efficiency_gap`` and ``<name>_mean_median``
+    read the metrics from it.
+    """
+    return {
+        name: PartisanTally(dem_key, rep_key, districts, alias=name, verify=verify),
+        name + "_seats": partial(_state_field, name, "seats"),
+        name + "_efficiency_gap": partial(_state_field, name, "efficiency_gap"),
+        name + "_mean_median": partial(_state_field, name, "mean_median"),
+    }
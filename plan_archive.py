@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Delta-encoded archive of every plan a chain visits.
+
+Each step is stored as the precincts that changed district since the step
+before (their positions in the graph's node order and their new district
+as a uint8 id), and every ``keyframe_every`` steps as a full assignment.
+Per chain the archive is three files in one directory:
+
+- ``plans-<chain>.bin``: the deltas and keyframes, back to back;
+- ``plans-<chain>.idx``: one fixed-size record per step with the byte
+  offset and length of its entry, whether it is a keyframe, and the plan's
+  hash;
+- ``plans-<chain>.json``: the node order, the district labels behind the
+  uint8 ids, the settings, and the number of steps flushed so far.
+
+Any step is rebuilt from the nearest keyframe at or before it plus the
+deltas after it. The hash of a plan is a Zobrist hash (the XOR of one
+random 64-bit key per precinct and district), updated from the moved
+precincts only, so repeated plans can be counted without comparing
+assignments.
+
+Example:
+
+    archive = PlanArchive("plans")
+    ensemble = read_ensemble("ensembles")
+    step = int(ensemble.loc[ensemble["efficiency_gap_sen"].idxmax(), "step"])
+    outlier = archive.partition(step, graph)
+    archive.duplicates()
+"""
+import json
+import os
+
+import numpy as np
+from gerrychain import Partition
+
+# One index record per step
+INDEX_DTYPE = np.dtype([("offset", np.uint64), ("count", np.uint32),
+                        ("keyframe", np.uint8), ("hash", np.uint64)])
+
+
+def archive_paths(directory, chain):
+    base = os.path.join(directory, "plans-{:04d}".format(chain))
+    return base + ".bin", base + ".idx", base + ".json"
+
+
+def zobrist_keys(n_nodes, n_districts, seed):
+    # Random 64-bit key of every (precinct, district) pair
+    return np.random.default_rng(seed).integers(0, 2 ** 64, size=(n_nodes, n_districts),
+                                                dtype=np.uint64)
+
+
+class _Layout:
+    # What the reader and the writer share: node order, district ids and hash keys
+
+    def _set_meta(self, meta):
+        self.meta = meta
+        self.nodes = meta["nodes"]
+        self.labels = meta["labels"]
+        self.label_ids = {label: i for i, label in enumerate(self.labels)}
+        self.position_dtype = np.dtype(meta["position_dtype"])
+        self.keys = zobrist_keys(len(self.nodes), len(self.labels), meta["zobrist_seed"])
+
+    def plan_hash(self, ids):
+        return np.bitwise_xor.reduce(self.keys[np.arange(len(ids)), ids])
+
+
+class PlanArchive(_Layout):
+    """Read access to one chain's archived plans."""
+
+    def __init__(self, directory, chain=0):
+        data_path, index_path, meta_path = archive_paths(directory, chain)
+        with open(meta_path) as f:
+            self._set_meta(json.load(f))
+        self.index = np.fromfile(index_path, dtype=INDEX_DTYPE)[:self.meta["steps"]]
+        self.data = np.memmap(data_path, dtype=np.uint8, mode="r") if self.meta["steps"] else None
+        self.keyframes = np.flatnonzero(self.index["keyframe"])
+
+    def __len__(self):
+        return len(self.index)
+
+    def _entry(self, step):
+        offset, count, keyframe = (int(v) for v in self.index[["offset", "count", "keyframe"]][step])
+        if keyframe:
+            return None, np.asarray(self.data[offset:offset + count])
+        size = count * self.position_dtype.itemsize
+        positions = np.frombuffer(self.data[offset:offset + size].tobytes(), dtype=self.position_dtype)
+        return positions, np.asarray(self.data[offset + size:offset + size + count])
+
+    def ids(self, step):
+        """District ids (indexes into ``labels``) of every node at ``step``."""
+        if not 0 <= step < len(self):
+            raise IndexError("step {} is not in the archive".format(step))
+        start = self.keyframes[np.searchsorted(self.keyframes, step, side="right") - 1]
+        ids = self._entry(start)[1].copy()
+        for s in range(start + 1, step + 1):
+            positions, new_ids = self._entry(s)
+            ids[positions] = new_ids
+        return ids
+
+    def assignment(self, step):
+        """Node -> district dict of the plan at ``step``."""
+        labels = np.asarray(self.labels, dtype=object)[self.ids(step)]
+        return dict(zip(self.nodes, labels.tolist()))
+
+    def partition(self, step, graph, updaters=None):
+        """The plan at ``step`` as a Partition of ``graph``."""
+        return Partition(graph, assignment=self.assignment(step), updaters=updaters)
+
+    @property
+    def hashes(self):
+        return self.index["hash"]
+
+    def duplicates(self):
+        """How often the chain revisits a plan it has already been in."""
+        hashes = self.hashes
+        unique = len(np.unique(hashes))
+        # A repeat is a step whose plan was seen at some earlier step; a
+        # step where the chain stayed put counts as one too
+        stayed = int(np.count_nonzero(hashes[1:] == hashes[:-1]))
+        return {"steps": len(hashes), "unique_plans": unique,
+                "repeated_steps": len(hashes) - unique,
+                "repeat_fraction": (len(hashes) - unique) / len(hashes) if len(hashes) else 0.0,
+                "unchanged_steps": stayed}
+
+
+class PlanArchiveRecorder(_Layout):
+    """
+    Appends every recorded step of a chain to the archive. It is a recorder
+    in the sense of demwin_ensemble.run_chain: ``record(step, part)`` for
+    every step and ``flush()`` at every checkpoint, which appends the steps
+    since the last one to the files. With ``resume`` set to the step of the
+    checkpoint to continue from, the archive is cut back to that step. The
+    first step recorded after a start or resume is always a keyframe.
+
+    :param directory: Output directory (created if missing).
+    :param graph: The chain's graph (fixes the node order).
+    :param districts: The district labels (at most 256).
+    :param chain: Chain id used in the file names.
+    :param keyframe_every: Steps between full assignments.
+    """
+
+    def __init__(self, directory, graph, districts, chain=0, keyframe_every=1000,
+                 resume=None, zobrist_seed=20240507):
+        os.makedirs(directory, exist_ok=True)
+        self.data_path, self.index_path, self.meta_path = archive_paths(directory, chain)
+        self.last = None
+        if resume is not None:
+            with open(self.meta_path) as f:
+                self._set_meta(json.load(f))
+            if self.meta["steps"] <= resume:
+                raise ValueError("plan archive of chain {} ends before step {}".format(
+                    chain, resume))
+            # Steps flushed after the checkpoint are recorded again
+            steps = self.meta["steps"] = resume + 1
+            reader = PlanArchive(directory, chain)
+            end = int(reader.index["offset"][steps - 1]) + self._size(reader.index[steps - 1])
+            del reader
+            os.truncate(self.index_path, steps * INDEX_DTYPE.itemsize)
+            os.truncate(self.data_path, end)
+            self._write_meta()
+        else:
+            labels = sorted(districts)
+            if len(labels) > 256:
+                raise ValueError("at most 256 districts fit in a uint8 id")
+            nodes = list(graph.nodes)
+            self._set_meta({
+                "nodes": nodes, "labels": labels,
+                "position_dtype": "uint16" if len(nodes) <= 2 ** 16 else "uint32",
+                "keyframe_every": keyframe_every, "zobrist_seed": zobrist_seed, "steps": 0})
+            for path in (self.data_path, self.index_path):
+                open(path, "wb").close()
+        self.position = {node: i for i, node in enumerate(self.nodes)}
+        self.current = None
+        self.offset = os.path.getsize(self.data_path)
+        self.steps = self.meta["steps"]
+        # Entries since the last flush
+        self.entries = []
+        self.records = []
+
+    def _size(self, record):
+        if record["keyframe"]:
+            return int(record["count"])
+        return int(record["count"]) * (self.position_dtype.itemsize + 1)
+
+    def _full_ids(self, part):
+        return np.array([self.label_ids[part.assignment[node]] for node in self.nodes],
+                        dtype=np.uint8)
+
+    def _changes(self, part):
+        # Positions and new ids of the nodes that moved since the last step
+        if part is self.last:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.uint8)
+        if part.parent is not None and part.flips:
+            positions = np.fromiter((self.position[node] for node in part.flips), dtype=np.int64)
+            ids = np.fromiter((self.label_ids[d] for d in part.flips.values()), dtype=np.uint8)
+        else:
+            ids = self._full_ids(part)
+            positions = np.arange(len(ids))
+        # Sorted by position, so the bytes do not depend on the flips' order
+        order = np.argsort(positions)
+        positions, ids = positions[order], ids[order]
+        moved = ids != self.current[positions]
+        return positions[moved], ids[moved]
+
+    def record(self, step, part):
+        if step != self.steps:
+            raise ValueError("expected step {} in the plan archive, got {}".format(self.steps, step))
+        # The first step recorded since the start or a resume is a keyframe,
+        # so no delta is taken against a plan this recorder did not see
+        keyframe = self.last is None or step % self.meta["keyframe_every"] == 0
+        if keyframe:
+            self.current = self._full_ids(part)
+            self.hash = self.plan_hash(self.current)
+            entry = self.current.tobytes()
+            count = len(self.current)
+        else:
+            positions, ids = self._changes(part)
+            self.hash ^= np.bitwise_xor.reduce(self.keys[positions, self.current[positions]]) \
+                ^ np.bitwise_xor.reduce(self.keys[positions, ids])
+            self.current[positions] = ids
+            entry = positions.astype(self.position_dtype).tobytes() + ids.tobytes()
+            count = len(positions)
+        self.last = part
+        self.entries.append(entry)
+        self.records.append((self.offset, count, keyframe, self.hash))
+        self.offset += len(entry)
+        self.steps = step + 1
+
+    def flush(self):
+        with open(self.data_path, "ab") as f:
+            f.write(b"".join(self.entries))
+        with open(self.index_path, "ab") as f:
+            f.write(np.array(self.records, dtype=INDEX_DTYPE).tobytes())
+        self.entries.clear()
+        self.records.clear()
+        self.meta["steps"] = self.steps
+        self._write_meta()
+
+    def _write_meta(self):
+        with open(self.meta_path + ".tmp", "w") as f:
+            json.dump(self.meta, f)
+        os.replace(self.meta_path + ".tmp", self.meta_path)
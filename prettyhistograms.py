@@ -5,6 +5,7 @@ Created on Wed May  8 00:59:43 2024
 @author: ozzma
 """
 
+import argparse
 import matplotlib.pyplot as plt
 from gerrychain import Graph, Partition, proposals, updaters, constraints, accept, MarkovChain, Election
 from gerrychain.updaters import cut_edges, Tally
@@ -15,15 +16,29 @@ import time
 import random
 import numpy as np
 import pandas as pd
+from ensemble_store import read_ensemble
+from graph_cache import load_graph
+from config import load_config
 
-graph = Graph.from_file("./IL/IL.shp")
+# Paths and elections come from the same config as cli.py
+parser = argparse.ArgumentParser()
+parser.add_argument("--config", default="config.json")
+parser.add_argument("--set", action="append", default=[], metavar="SECTION.KEY=VALUE")
+args = parser.parse_args()
+config = load_config(args.config, args.set)
 
-ensembles = pd.read_csv("ensembles.csv")
+graph = load_graph(config["paths"]["shapefile"])
+
+# Loads only the plotted columns from the streamed ensemble store
+ensembles = read_ensemble(config["paths"]["ensemble_dir"], columns=[
+    'cutedge_ensemble', 'pres_demwin_ensemble', 'sen_demwin_ensemble',
+    'efficiency_gap_pres', 'efficiency_gap_sen',
+    'mean_median_diff_sen', 'mean_median_diff_pres'])
 
 
 elections = [
-    Election("G20PRE", {"Democratic": "G20PRED", "Republican": "G20PRER"}),
-    Election("G20USS", {"Democratic": "G20USSD", "Republican": "G20USSR"})
+    Election(name, {"Democratic": dem, "Republican": rep})
+    for name, (dem, rep) in config["plan"]["elections"].items()
 ]
 
 # Population updater, for computing how close to equality the district
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Sorted district vote-share matrices recorded during the ensemble run.
+
+For each election, every step's Democratic shares are sorted and written as
+one row of a dense float32 (steps x districts) matrix stored as a
+memory-mapped .npy file, one file per election and chain. Row 0 is the
+enacted plan. Box plots and marginal quantiles are computed a few columns
+at a time, so the matrix never has to fit in memory.
+"""
+import glob
+import json
+import os
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+
+def matrix_path(directory, name, chain):
+    return os.path.join(directory, "{}-{:04d}.npy".format(name, chain))
+
+
+def steps_path(directory, chain):
+    # Number of rows of the chain's matrices that hold recorded steps
+    return os.path.join(directory, "steps-{:04d}.json".format(chain))
+
+
+class ShareRecorder:
+    """
+    Writes the sorted share vector of each election (read from the
+    partition's PartisanTally updaters, see partisan_updaters.py) into the
+    chain's matrices.
+
+    :param directory: Output directory (created if missing).
+    :param names: Names of the PartisanTally updaters to record.
+    :param total_steps: Number of rows to allocate. Existing matrices with
+        fewer rows are grown on resume, and any matrix is grown (doubled)
+        when a step goes past its last row.
+    :param num_dist: Number of districts (columns).
+    :param chain: Chain id used in the file names.
+    :param resume: Step of the checkpoint to continue from: the existing
+        matrices are reopened and the rows after it overwritten. None to
+        create new matrices.
+    """
+
+    def __init__(self, directory, names, total_steps, num_dist, chain=0, resume=None):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.chain = chain
+        if resume is not None:
+            self.matrices = {name: open_memmap(matrix_path(directory, name, chain), mode="r+")
+                             for name in names}
+            with open(steps_path(directory, chain)) as f:
+                flushed = json.load(f)["steps"]
+            if flushed <= resume:
+                raise ValueError("share matrices of chain {} end before step {}".format(
+                    chain, resume))
+            # Rows flushed after the checkpoint are recorded again
+            self.steps = resume + 1
+            self._grow(total_steps)
+        else:
+            self.matrices = {name: open_memmap(matrix_path(directory, name, chain), mode="w+",
+                                               dtype=np.float32, shape=(total_steps, num_dist))
+                             for name in names}
+            self.steps = 0
+
+    def _grow(self, rows):
+        # Copies the recorded rows into larger matrices, which then replace
+        # the files (a memory map cannot be resized in place)
+        for name, matrix in list(self.matrices.items()):
+            if len(matrix) >= rows:
+                continue
+            path = matrix_path(self.directory, name, self.chain)
+            grown = open_memmap(path + ".tmp", mode="w+", dtype=matrix.dtype,
+                                shape=(rows,) + matrix.shape[1:])
+            for start in range(0, self.steps, 1 << 16):
+                stop = min(start + (1 << 16), self.steps)
+                grown[start:stop] = matrix[start:stop]
+            grown.flush()
+            del matrix, self.matrices[name]
+            os.replace(path + ".tmp", path)
+            self.matrices[name] = grown
+
+    def record(self, step, part):
+        if step >= len(next(iter(self.matrices.values()))):
+            self._grow(max(step + 1, 2 * self.steps))
+        for name, matrix in self.matrices.items():
+            matrix[step] = np.sort(part[name].shares)
+        self.steps = step + 1
+
+    def flush(self):
+        for matrix in self.matrices.values():
+            matrix.flush()
+        with open(steps_path(self.directory, self.chain), "w") as f:
+            json.dump({"steps": self.steps}, f)
+
+
+def read_share_matrices(directory, name):
+    """Read-only memory maps of every chain's recorded rows for one election."""
+    matrices = []
+    for path in sorted(glob.glob(os.path.join(directory, name + "-*.npy"))):
+        chain = int(os.path.basename(path)[len(name) + 1:-len(".npy")])
+        with open(steps_path(directory, chain)) as f:
+            steps = json.load(f)["steps"]
+        matrices.append(np.load(path, mmap_mode="r")[:steps])
+    if not matrices:
+        raise FileNotFoundError(
+            "no share matrices of '{}' in {}; rerun the chain with run.record_shares=true "
+            "(record_shares = True in demwin_ensemble.py)".format(name, directory))
+    return matrices
+
+
+def _column_blocks(matrices, columns_per_block):
+    # Loads a few columns of every chain at a time
+    num_columns = matrices[0].shape[1]
+    for start in range(0, num_columns, columns_per_block):
+        yield np.concatenate([np.asarray(m[:, start:start + columns_per_block])
+                              for m in matrices])
+
+
+def column_quantiles(matrices, q, columns_per_block=8):
+    """Quantiles ``q`` of every sorted-district column, shaped (len(q) x districts)."""
+    return np.hstack([np.nanquantile(block, q, axis=0)
+                      for block in _column_blocks(matrices, columns_per_block)])
+
+
+def box_stats(matrices, columns_per_block=8):
+    """Per-column statistics in the form matplotlib's ``Axes.bxp`` draws."""
+    from matplotlib import cbook
+
+    stats = []
+    for block in _column_blocks(matrices, columns_per_block):
+        stats.extend(cbook.boxplot_stats(block))
+    return stats
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Short-burst optimization for finding extreme plans.
+
+A neutral chain wanders towards the tails of a statistic very slowly. Short
+bursts (Cannon et al., "Voting Rights, Markov Chains, and Optimization by
+Short Bursts") run many short chains instead, each starting from the best
+plan found so far, with the proposal and population constraint of
+demwin_ensemble.make_chain. The objective is any updater of
+demwin_ensemble.make_updaters (e.g. ``sen_seats``, ``pres_efficiency_gap``
+or ``demographics_latino_opportunity``), maximized or minimized.
+
+Within a burst every valid proposal is accepted (as in the neutral chain)
+unless ``tilt`` is set: then a proposal that scores worse than the current
+plan is only accepted with probability ``tilt``, while equal or better ones
+always are.
+
+Each round runs ``processes`` bursts in parallel from the current best
+plan, and the best plan any of them visits becomes the start of the next
+round. Every burst has its own seed from one master seed, so a run is
+reproducible. The result holds the best distinct plans found, with their
+ensemble metrics and assignments, and the best score after each round
+against the number of chain steps spent.
+
+Example:
+
+    result = short_bursts(graph, "sen_seats", bursts=200, burst_length=10)
+    result["best"][0]["score"], result["best"][0]["metrics"]
+
+or ``python short_bursts.py sen_seats --minimize --tilt 0.05``.
+"""
+import argparse
+import json
+import os
+import random
+import time
+from multiprocessing import Pool
+
+import numpy as np
+from gerrychain.accept import always_accept
+
+import demwin_ensemble
+from demwin_ensemble import (ENSEMBLE_COLUMNS, ensemble_row, make_chain,
+                             make_initial_partition)
+from ensemble_runner import chain_seeds
+from graph_cache import load_graph
+from config import DEFAULT_CONFIG
+
+# Graph and enacted plan shared by the bursts of one worker process, set by
+# _init_worker
+_worker_graph = None
+_worker_plan = None
+
+
+def tilted_accept(objective, maximize, tilt):
+    """Acceptance function taking worse plans (by ``objective``) with probability ``tilt``."""
+    sign = 1 if maximize else -1
+
+    def accept(partition):
+        if partition.parent is None:
+            return True
+        if sign * (partition[objective] - partition.parent[objective]) >= 0:
+            return True
+        return random.random() < tilt
+    return accept
+
+
+def _plan(part, objective):
+    # Score, ensemble metrics and assignment of one plan
+    return {"score": float(part[objective]),
+            "metrics": {name: float(value)
+                        for name, value in zip(ENSEMBLE_COLUMNS, ensemble_row(part))},
+            "assignment": dict(part.assignment)}
+
+
+def _init_worker(graph, settings):
+    global _worker_graph, _worker_plan
+    # Module settings such as num_dist may differ from the defaults in the
+    # parent process, which spawned workers would not see
+    for name, value in settings.items():
+        setattr(demwin_ensemble, name, value)
+    _worker_graph = graph
+    _worker_plan = make_initial_partition(graph)
+
+
+def _run_burst(task):
+    # Runs one burst and returns the best plan it visited
+    seed, assignment, burst_length, objective, maximize, tilt = task
+    random.seed(seed)
+    np.random.seed(seed)
+
+    sign = 1 if maximize else -1
+    state = make_initial_partition(_worker_graph, assignment=assignment)
+    accept = always_accept if tilt is None else tilted_accept(objective, maximize, tilt)
+    chain = make_chain(_worker_graph, state, burst_length + 1, _worker_plan, accept=accept)
+    best, best_score = None, None
+    for i, part in enumerate(chain):
+        # The burst's first state is the plan it started from
+        if i == 0:
+            continue
+        score = sign * part[objective]
+        if best is None or score > best_score:
+            best, best_score = part, score
+    return _plan(best, objective)
+
+
+def short_bursts(graph, objective, maximize=True, bursts=100, burst_length=10, tilt=None,
+                 keep=10, target=None, master_seed=DEFAULT_CONFIG["run"]["master_seed"],
+                 processes=None, assignment="SSD"):
+    """
+    Runs ``bursts`` bursts of ``burst_length`` steps optimizing the updater
+    ``objective`` from the plan ``assignment``, ``processes`` at a time
+    (one per core by default), stopping early once the best score reaches
+    ``target``.
+
+    Returns a dict with the starting plan's score (``start``), the ``keep``
+    best distinct plans found (``best``, each with its score, ensemble
+    metrics and assignment, best first), the best score after each round
+    (``trace``, with the chain steps spent so far) and the total number of
+    ``steps``. Proposals that fail the population constraint are retried by
+    the chain and not counted.
+    """
+    if burst_length < 1:
+        raise ValueError("burst_length must be at least 1, got {}".format(burst_length))
+    processes = processes or os.cpu_count()
+    sign = 1 if maximize else -1
+    seeds = chain_seeds(master_seed, bursts)
+    settings = {"num_dist": demwin_ensemble.num_dist,
+                "pop_tolerance": demwin_ensemble.pop_tolerance}
+
+    start = make_initial_partition(graph, assignment=assignment)
+    current = _plan(start, objective)
+    # The best plans so far, by their assignment in node order so that a
+    # plan found twice counts once
+    found = {}
+    trace = []
+    steps = 0
+
+    with Pool(processes, initializer=_init_worker, initargs=(graph, settings)) as pool:
+        for first in range(0, bursts, processes):
+            tasks = [(seed, current["assignment"], burst_length, objective, maximize, tilt)
+                     for seed in seeds[first:first + processes]]
+            results = pool.map(_run_burst, tasks, chunksize=1)
+            steps += len(tasks) * burst_length
+
+            for result in results:
+                found.setdefault(tuple(result["assignment"][node] for node in graph.nodes), result)
+            found = dict(sorted(found.items(), key=lambda item: -sign * item[1]["score"])[:keep])
+            round_best = max(results, key=lambda result: sign * result["score"])
+            if sign * round_best["score"] >= sign * current["score"]:
+                current = round_best
+            trace.append({"steps": steps, "score": current["score"]})
+            if target is not None and sign * current["score"] >= sign * target:
+                break
+
+    best = list(found.values())
+    return {"objective": objective, "maximize": maximize, "burst_length": burst_length,
+            "tilt": tilt, "start": float(start[objective]), "steps": steps,
+            "trace": trace, "best": best}
+
+
+def write_bursts(path, result, graph):
+    """Save a short_bursts result as JSON, with assignments as lists in node order."""
+    nodes = list(graph.nodes)
+    saved = dict(result, nodes=nodes, best=[
+        dict(plan, assignment=[plan["assignment"][node] for node in nodes])
+        for plan in result["best"]])
+    with open(path + ".tmp", "w") as f:
+        json.dump(saved, f)
+    os.replace(path + ".tmp", path)
+
+
+def read_bursts(path):
+    """Read a saved result back, with every assignment as a node -> district dict."""
+    with open(path) as f:
+        result = json.load(f)
+    nodes = result.pop("nodes")
+    for plan in result["best"]:
+        plan["assignment"] = dict(zip(nodes, plan["assignment"]))
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("objective", help="updater to optimize, e.g. sen_seats")
+    parser.add_argument("--minimize", action="store_true")
+    parser.add_argument("--bursts", type=int, default=1000)
+    parser.add_argument("--burst-length", type=int, default=10)
+    parser.add_argument("--tilt", type=float,
+                        help="probability of accepting a worse plan within a burst")
+    parser.add_argument("--target", type=float, help="stop once the best score reaches this")
+    parser.add_argument("--keep", type=int, default=10, help="number of best plans kept")
+    parser.add_argument("--processes", type=int)
+    parser.add_argument("--output", default="bursts.json")
+    args = parser.parse_args()
+
+    start_time = time.time()
+
+    il_graph = load_graph(DEFAULT_CONFIG["paths"]["shapefile"])
+    result = short_bursts(il_graph, args.objective, not args.minimize, args.bursts,
+                          args.burst_length, args.tilt, args.keep, args.target,
+                          processes=args.processes)
+    write_bursts(args.output, result, il_graph)
+
+    print("Enacted plan:", result["start"])
+    for plan in result["best"]:
+        print(plan["score"], plan["metrics"])
+
+    end_time = time.time()
+    print(result["steps"], "steps in", (end_time-start_time)/60, "mins")
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Content-addressed cache for the stages of the MAUP.py preprocessing pipeline.
+
+Each stage is a function whose result is stored on disk under a key made
+from the stage name, the function's code, its parameters and the digests
+of its inputs. Inputs
+are either source files (digested by content) or the results of earlier
+stages, whose digest is the hash of the stored result itself. A stage whose
+output comes out unchanged therefore leaves every stage after it valid:
+swapping in a new election file with the same precinct geometry reruns the
+election stages but not the block assignment.
+
+Example:
+
+    cache = StageCache("./cache")
+    blocks = cache.run("read_blocks", read_layer, SourceFile("blocks.shp"))
+    assignment = cache.run("assign", assign, blocks, precincts)
+    cache.print_report()
+"""
+import hashlib
+import os
+import pickle
+import sys
+import time
+import types
+
+from graph_cache import shapefile_hash
+
+# Directory of this project's modules, whose functions stage keys cover
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class SourceFile:
+    """A file read by a stage, identified by the hash of its contents."""
+
+    def __init__(self, path):
+        self.path = path
+        if path.endswith(".shp"):
+            # A shapefile's data is spread over its sidecar files too
+            self.digest = shapefile_hash(path)
+        else:
+            digest = hashlib.sha256()
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(chunk)
+            self.digest = digest.hexdigest()
+
+    @property
+    def value(self):
+        return self.path
+
+
+class StageResult:
+    """The value returned by a stage and the digest of its stored bytes."""
+
+    def __init__(self, value, digest):
+        self.value = value
+        self.digest = digest
+
+
+def _update_code(digest, code):
+    # Bytecode, names and constants, nested code objects (lambdas,
+    # comprehensions) included
+    digest.update(code.co_code)
+    digest.update(repr(code.co_names).encode())
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            _update_code(digest, const)
+        elif isinstance(const, frozenset):
+            # Set literals, in an order that does not depend on the hash seed
+            digest.update(repr(sorted(const, key=repr)).encode())
+        else:
+            digest.update(repr(const).encode())
+
+
+def _is_project_module(module):
+    # Modules of this project (next to this file), not the standard library
+    # or installed packages
+    path = getattr(sys.modules.get(module), "__file__", None)
+    return path is not None and os.path.dirname(os.path.abspath(path)) == PROJECT_DIR
+
+
+def _code_names(code):
+    # Global and attribute names used by a function, nested code included
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names |= _code_names(const)
+    return names
+
+
+def code_digest(function):
+    """
+    Hash of a stage function's code and of every function of this project
+    it calls (directly or not, by name or as ``module.function``), so that
+    editing any of them invalidates the stage's cached results.
+    """
+    digest = hashlib.sha256()
+    seen = set()
+    pending = [function]
+    while pending:
+        f = pending.pop()
+        if f in seen:
+            continue
+        seen.add(f)
+        digest.update((f.__module__ + "." + f.__qualname__).encode())
+        _update_code(digest, f.__code__)
+        names = sorted(_code_names(f.__code__))
+        for name in names:
+            called = f.__globals__.get(name)
+            if isinstance(called, types.ModuleType) and _is_project_module(called.__name__):
+                # Functions used as attributes of a project module
+                pending.extend(getattr(called, attribute) for attribute in names
+                               if isinstance(getattr(called, attribute, None), types.FunctionType)
+                               and _is_project_module(getattr(called, attribute).__module__))
+            elif isinstance(called, types.FunctionType) and _is_project_module(called.__module__):
+                pending.append(called)
+    return digest.hexdigest()
+
+
+class StageCache:
+    def __init__(self, directory):
+        self.directory = directory
+        self.report = []
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, name, function, inputs, params):
+        key = hashlib.sha256()
+        key.update(name.encode())
+        key.update(code_digest(function).encode())
+        key.update(repr(sorted(params.items())).encode())
+        for item in inputs:
+            key.update(item.digest.encode())
+        return key.hexdigest()
+
+    def run(self, name, function, *inputs, **params):
+        """
+        Return the result of ``function(*input values, **params)`` as a
+        StageResult, loading it from the cache when the key matches.
+        """
+        start_time = time.time()
+        key = self.key(name, function, inputs, params)
+        path = os.path.join(self.directory, "{}-{}.pkl".format(name, key[:16]))
+
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                data = f.read()
+            value = pickle.loads(data)
+            status = "hit"
+        else:
+            value = function(*(item.value for item in inputs), **params)
+            data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            with open(path + ".tmp", "wb") as f:
+                f.write(data)
+            os.replace(path + ".tmp", path)
+            status = "miss"
+
+        result = StageResult(value, hashlib.sha256(data).hexdigest())
+        self.report.append((name, status, time.time() - start_time))
+        return result
+
+    def print_report(self):
+        # One line per stage run: whether it came from the cache and how long it took
+        print("{:<28} {:<6} {:>10}".format("stage", "cache", "seconds"))
+        for name, status, seconds in self.report:
+            print("{:<28} {:<6} {:>10.2f}".format(name, status, seconds))